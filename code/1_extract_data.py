@@ -1,24 +1,45 @@
 # Code generates summary statistics for a REGEN run. extracts values REGEN output GDX files and puts into CSV files
+# Run for every scenario with `python 1_extract_data.py`, or pass scenario names / glob patterns to run a subset.
 import os
+import re
+import time
+import argparse
+import fnmatch
+import functools
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import pandas as pd
-import gams.transfer as gt
+from gdx_cache import GdxCache
+from gdx_reader import READERS, get_reader
+from manifest import Manifest
+from schema import schema
+from input_cache import InputCache
+from output_formats import OUTPUT_FORMATS, COMPRESSION, output_file, check_compression, write_output_file
+from writer_pool import WriterPool
+from watcher import Watcher
+from deltas import DELTA_METRICS, scenario_deltas
+from store import OutputStore, STORE_FILE
+from dag import Graph
+from mapping import map_unique, keep_unique
+from chunked import chunked_groupby, unique_keys, join_unique
+from hours import expand_join
+from rollup import rollup, to_wide
+from summaries import (YearHourGrid, hour_of_day, month, descending_rank, duration_curve, ntile, group_means,
+                       HOURS_PER_DAY)
+from memory import available_memory, current_rss
+from profiling import Profiler, REPORT_FILE, combine_reports, summary_table, save_report
 # Model paths just runs line os.chdir(os.path.dirname(os.path.abspath(__file__)))
 # VS code doesn't have __file__ when running in interactive mode, so need to import from another path.
 # If this fails when you run it, then replace import model_paths with os.chdir(<PATH_TO_THIS_SCRIPT>)
 import model_paths
 import numpy as np
 #____________________________________________
-# Get file path and scenario name
+# Get file path and regional aggregation. Scenarios are selected on the command line (see main)
 main_folder = os.path.abspath("../../CA_REGEN_v0")
 ragg = "allstate"
-# Gives a list of scenarios. You can print them out to see which scenarios are available
-scenarios = os.listdir(os.path.join(main_folder, "RegenCases", ragg))
-print(scenarios)
-#Update scenario name as needed
-scen = "min_compliance"
-output_folder = os.path.join("../", "cleaned_data", scen)
-if not os.path.exists(output_folder):
-    os.makedirs(output_folder)
+# Outputs are written to <output_root>/<scen>
+output_root = os.path.join("../", "cleaned_data")
 #___________________________________________
 TECH_SET = {
     'wind': 'Wind',
@@ -72,25 +93,75 @@ COLUMN_NAMES = {"i": "tech_class",  #generators
                 "f": "fuel"}
 
 RE_TECH = ['Solar', "Wind", "Offshore Wind"]
+
+TYPE_TO_TECH = {"xnuc": "Nuclear", "nnuc": "Nuclear", "nuca": "Nuclear",
+                "geot": "Geothermal", "hydr": "Hydro", "bioe": "Bio", "othc": "Bio", "h2": "Hydrogen",
+                "becs": "Bio CCS", "xcol": "Coal", "ncol": "Coal", "clcs": "Coal CCS",
+                "xngc": "Gas-CC", "nngc": "Gas-CC", "ngcs": "Gas CCS", "xngp": "Gas-CT", "nngp": "Gas-CT", "dfcap": "Gas-CT",
+                "ptpk": "Gas-CT", "h2cc": "Hydrogen", "xwnd": "Wind", "nwnd": "Wind",
+                "wnos": "Wind", "xspv": "Solar", "nspv": "Solar", "xcsp": "Solar",
+                "ncsp": "Solar", "stor": "Storage", "rfpv": "Solar", "peakload": "Peak Load"}
+
+
+STATE_MAPPING = {'BANC_TID': "ca", 'IID': "ca", 'LDWP': "ca", 'Other': "ca", 'PGE':"ca", 'SCE': "ca", 'SDGE': "ca",
+                 'Oregon': "rest_of_wecc", 'Washington': "rest_of_wecc", 'Nevada': "rest_of_wecc", 'Arizona': "rest_of_wecc",
+                 'New_Mexico': "rest_of_wecc", 'Utah': "rest_of_wecc", 'Colorado': "rest_of_wecc", 'Idaho': "rest_of_wecc",
+                 'Montana': "rest_of_wecc", 'Wyoming': "rest_of_wecc"}
+
+# Aggregate region of each region at every level outputs can be rolled up to (see rollup.py and region_levels).
+# Add a level here to aggregate to new regions.
+REGION_LEVELS = {"state": STATE_MAPPING, "wecc": {region: "WECC" for region in STATE_MAPPING}}
+
+year_list = [2020, 2025, 2030, 2035, 2040, 2045, 2050]
+# Increase when a change to the code changes the contents of the outputs, so existing outputs are rebuilt
+TRANSFORM_VERSION = 2
+# Outputs that are stored at segment level with --segment-outputs, and expanded to hours with hours.HourIndex
+SEGMENT_OUTPUTS = ["dispatch_by_segment_gwh", "trade_gw"]
+
+# Hours of highest net load averaged in net_load_peak_hours, and number of net load groups in
+# net_load_decile_dispatch
+PEAK_NET_LOAD_HOURS = 25
+NET_LOAD_GROUPS = 10
+
+# Rough ratio of peak memory use to the size of a scenario's model GDX file. Used to cap the number of workers.
+MEMORY_PER_GDX_BYTE = 10
+
+# Every GDX read goes through the cache so each file is only read once per scenario.
+# extract_scenario replaces it with a fresh cache for each scenario.
+gdx_cache = GdxCache()
+# GDX paths of the scenario being extracted, by source (see source_paths). Set by extract_scenario.
+scenario_paths = {}
+# Write ca_hourly_mapping one chunk at a time, and the peak memory (GB) allowed while building it. Set by extract_scenario.
+stream_hourly = False
+hourly_rss_limit_gb = None
+# Profiler of the scenario being extracted, or None if the run is not profiled. Set by extract_scenario.
+profiler = None
+# Cache of the scenario independent inputs (see cached_input), or None to always build them from GDX. Set by
+# extract_scenario.
+input_cache = None
+# Function reading symbols from a GDX file (see gdx_reader.py). If set, it is used instead of the reader chosen with
+# --reader. benchmark.py sets it to serve synthetic inputs.
+gdx_reader = None
 #____________________________________________
 
-def load_gdx_symbol(gdx_path: str, symbol: str) -> pd.DataFrame:
+def load_gdx_symbol(gdx_path: str, symbol: str, where: dict = None) -> pd.DataFrame:
     """
     Load a symbol from a GDX file into a pandas dataframe.
 
     Parameters:
     gdx_path   (str)           : The path to the GDX file.
     symbol     (str)           : The symbol to load from the GDX file.
-    level_only (bool, optional): If True, then marginal, lower, upper, and scale columns are dropped. Defaults to True.
+    where      (dict, optional): Only keep records passing these filters on the GDX domain columns, see filter_records.
+                                 Filters are on the element labels, e.g. years as strings (see model_years).
     Returns:
-    pd.DataFrame: The data from the symbol in a pandas dataframe.
+    pd.DataFrame: The data from the symbol in a pandas dataframe, with the column types of schema.py.
     """
     if not os.path.exists(gdx_path):
         print(f"{gdx_path} does not exist.")
         return None
 
     try:
-        df = gt.Container(gdx_path).data[symbol].records
+        df = gdx_cache.get(gdx_path, symbol)
     except KeyError:
         print(f"Error loading {symbol}. Check if {symbol} is in GDX file.")
         return None
@@ -98,15 +169,51 @@ def load_gdx_symbol(gdx_path: str, symbol: str) -> pd.DataFrame:
     for col in ["marginal", "lower", "upper", "scale", "element_text"]:
         if col in df.columns:
             df.drop(columns=[col], inplace=True)
+    if profiler is not None:
+        profiler.add_rows_in(len(df))
+    if where:
+        df = filter_records(df, where)
+    # Years and hours as int16, other domains as categoricals shared across symbols (see schema.py)
+    return schema.normalize(df, symbol)
 
-    return df
+def filter_records(df: pd.DataFrame, where: dict) -> pd.DataFrame:
+    """
+    Keep the rows of df whose columns pass every filter in where: column -> list of values to keep, or a function of a
+    value returning True for values to keep (e.g. is_re_tech_class). Each unique value is only tested once.
+    """
+    keep = np.ones(len(df), dtype=bool)
+    for col, allowed in where.items():
+        keep &= keep_unique(df[col], allowed if callable(allowed) else set(allowed).__contains__)
+    return df if keep.all() else df[keep]
+
+def is_re_tech_class(tech_class: str) -> bool:
+    """
+    True if tech_class maps to a renewable tech in RE_TECH.
+    """
+    return TECH_SET.get(tech_class.split("-")[0]) in RE_TECH
+
+def model_years() -> list:
+    """
+    Years in year_list as they appear in the GDX files.
+    """
+    return [str(year) for year in year_list]
+
+def segdata_where(symbol: str, regions) -> dict:
+    """
+    Filters (see filter_records) of the records of an endusescen segdata symbol used for the California regions in
+    regions: the years in year_list, and renewable tech classes for availability factors (vrsc).
+    """
+    where = {"r": regions, "t": model_years()}
+    if symbol == "vrsc":
+        where["uni"] = is_re_tech_class
+    return where
 
 def get_tech(df: pd.DataFrame, techs: dict) -> pd.DataFrame:
     """
-    Splits tech_class by "-" and maps to the techs dictionary.
+    Splits tech_class by "-" and maps to the techs dictionary. Each unique tech class is only split and mapped once.
     """
-    df['tech'] = df['tech_class'].apply(lambda x: x.split("-")[0]).map(techs)
-    return df
+    # assign returns a new frame so the caller's frame (e.g. capacity, which is merged again later) is not modified
+    return df.assign(tech = map_unique(df['tech_class'], lambda x: techs.get(x.split("-")[0], np.nan), "tech class"))
 
 def current_dollars(df: pd.DataFrame, col: str, deflator: float = DEFLATOR_2010_TO_2024):
     """
@@ -115,19 +222,45 @@ def current_dollars(df: pd.DataFrame, col: str, deflator: float = DEFLATOR_2010_
     df[col] = df[col] * deflator
     return df
 
-def subset_data(df: pd.DataFrame, colname: str, sub: list) -> pd.DataFrame:
+def region_levels(names: list, cal_r=None) -> dict:
     """
-    Subset Dataframe for column to be in sub list
+    Rollup levels (see rollup.py) by name: region for the regions themselves, california for the regions in cal_r,
+    or a level of REGION_LEVELS.
     """
-    df = df[df[colname].isin(sub)]
-    return df
+    levels = {"region": None, **REGION_LEVELS}
+    if cal_r is not None:
+        levels["california"] = {region: "California" for region in cal_r}
+    return {name: levels[name] for name in names}
 
-def map_col(df: pd.DataFrame, col: str, mapping: dict) -> pd.DataFrame:
+def count_rows(df, record: dict):
     """
-    map column to map dictionary
+    Add the rows of df, a DataFrame or an iterable of chunks, to record["rows_out"] as they are written.
     """
-    df[col] = df[col].map(mapping)
-    return df
+    if isinstance(df, pd.DataFrame):
+        record["rows_out"] = len(df)
+        return df
+    def counted():
+        record["rows_out"] = 0
+        for chunk in df:
+            record["rows_out"] += len(chunk)
+            yield chunk
+    return counted()
+
+def path_size(path: str) -> int:
+    """
+    Size of a file, or of every file in a folder (outputs partitioned by year).
+    """
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+    return os.path.getsize(path)
+
+def check_rss(step: str):
+    """
+    Raise MemoryError if this process is using more memory than hourly_rss_limit_gb.
+    """
+    rss = current_rss() if hourly_rss_limit_gb is not None else None
+    if rss is not None and rss > hourly_rss_limit_gb * 1e9:
+        raise MemoryError(f"{step} used {rss / 1e9:.1f} GB, above the --max-rss-gb ceiling of {hourly_rss_limit_gb} GB")
 
 def add_tech(df: pd.DataFrame, tech: str) -> pd.DataFrame:
     """
@@ -136,371 +269,1236 @@ def add_tech(df: pd.DataFrame, tech: str) -> pd.DataFrame:
     df["tech"] = tech
     return df
 
+
 #____________________________________________
+# Extraction steps. Each output is a node in the pipeline graph that declares the GDX symbols it reads, and
+# takes the intermediates it needs (cal_r, capacity, rep_hours, ...) as arguments. Running a subset of outputs
+# only loads and computes what they need.
+# Symbols are filtered as they are loaded (see filter_records): to California regions for California outputs, and to
+# the years in year_list for outputs joined with the hour to segment mapping, which only has those years.
+
+pipeline = Graph()
+
+def cached_input(symbols: dict):
+    """
+    Decorator for transforms of the sources that are the same for every scenario in a regional aggregation (those
+    source_paths gives without a scenario). symbols is source -> GDX symbols the transform reads. The result is
+    served from the input cache (see input_cache.py) when it holds one computed from the same files with the same
+    arguments and year_list, and stored there otherwise.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def cached(*args, **kwargs):
+            sources = {path: names for source, names in symbols.items() for path in scenario_paths[source]}
+            if input_cache is None or not all(os.path.exists(path) for path in sources):
+                return func(*args, **kwargs)
+            key = input_cache.key(func.__name__, sources, (args, sorted(kwargs.items()), year_list))
+            value = input_cache.load(key)
+            if value is not None:
+                # Records of a single symbol keep its column names, whose domains can depend on the symbol
+                names = {name for names in symbols.values() for name in names}
+                value = schema.conform(value, names.pop() if len(names) == 1 else None)
+                # The symbols were registered with the GDX cache for this step, which no longer needs them
+                for path, names in sources.items():
+                    for name in names:
+                        gdx_cache.release(path, name)
+                return value
+            value = func(*args, **kwargs)
+            input_cache.save(key, func.__name__, sources, value)
+            return value
+        return cached
+    return decorate
+
+def load_source(source: str, symbol: str, where: dict = None) -> pd.DataFrame:
+    """
+    Load a symbol from the current scenario's GDX file for source (see source_paths), keeping only the records passing
+    where (see filter_records).
+    """
+    return load_gdx_symbol(scenario_paths[source][0], symbol, where)
+
+@pipeline.node(symbols={"model": ["cal_r"]})
+def cal_r():
+    # Get regions in California, as plain labels so the input cache keys of transforms taking them do not depend on the
+    # categories the region domain has gathered so far (see schema.py)
+    return np.asarray(load_source("model", "cal_r").r, dtype=str)
+
+@pipeline.node(symbols={"model": ["XC"]})
+def capacity():
+    # Generator capacity by tech class and vintage
+    return (load_source("model", "XC")
+            .rename(columns=COLUMN_NAMES).rename(columns={"level": "capacity"})
+            )
+
+@pipeline.node(symbols={"hrep": ["hrep"]})
+@cached_input({"hrep": ["hrep"]})
+def rep_hours():
+    # Hour to segment mapping for each year. There is a file per year, read concurrently
+    paths = scenario_paths["hrep"]
+    with ThreadPoolExecutor(min(len(paths), 8)) as pool:
+        hrep = list(pool.map(lambda path: load_gdx_symbol(path, "hrep"), paths))
+    return (
+        pd.concat(hrep)
+        .rename(columns={"s":"segment","t": "year"})
+        )
+
+@pipeline.output()
+def hour_segments(rep_hours):
+    # Segment of every hour, used to expand segment level outputs to hours (see hours.py)
+    return rep_hours[["year", "hour", "segment"]]
+
+def expand_to_hours(df: pd.DataFrame, rep_hours: pd.DataFrame) -> pd.DataFrame:
+    """
+    Copy each segment level row of df onto every hour of its segment, the same as merging with rep_hours on year and
+    segment. Returns df unchanged when rep_hours is None, which it is for SEGMENT_OUTPUTS written at segment level.
+    """
+    if rep_hours is None:
+        return df
+    return expand_join(df, rep_hours, ["year", "segment"])
+
+@pipeline.node(symbols={"segdata_8760": ["load_s"]})
+@cached_input({"segdata_8760": ["load_s"]})
+def h_load(cal_r):
+    # Hourly load for California
+    # Get only CA regions
+    return (load_source("segdata_8760", "load_s", where=segdata_where("load_s", cal_r))
+            .rename(columns = COLUMN_NAMES).rename(columns = {"value":"load_h"})
+            .groupby(["year", "hour"], observed=True)
+            .agg({"load_h": "sum"})
+            .reset_index()
+            )
+
+@pipeline.node(symbols={"segdata_100": ["load_s"]})
+@cached_input({"segdata_100": ["load_s"]})
+def s_load(cal_r):
+    # Segment load for California
+    # Get only CA regions
+    return (load_source("segdata_100", "load_s", where=segdata_where("load_s", cal_r))
+            .rename(columns = COLUMN_NAMES).rename(columns = {"value":"load_s"})
+            .groupby(["year", "segment"], observed=True)
+            .agg({"load_s": "sum"})
+            .reset_index()
+            )
 
+@pipeline.node(symbols={"report": ["dspsrpt_r"]})
+def hydrogen_loads(cal_r):
+    return (load_source("report", "dspsrpt_r",
+                        where={"uni_0": ["demand"], "uni_3": ["h2prod_ht", "h2prod_ne", "h2prod_pa", "h2stortrn"],
+                               "r_2": cal_r, "t_4": model_years()})
+            .rename(columns = {"uni_0": "group", "s_1": "segment", "r_2": "region", "uni_3": "type", "t_4": "year", "value": "hydrogen_load"})
+            .groupby(["year", "segment"], observed=True)
+            .agg({"hydrogen_load": "sum"})
+            .reset_index()
+    )
 
-model_results_path = os.path.join(main_folder, "RegenCases", ragg, scen, "elec", "out", scen + ".elec.gdx")
-report_path = os.path.join(main_folder, "RegenCases", ragg, scen, "elec", "report", scen + ".elec_rpt.gdx")
-reporting_results_path = os.path.join(main_folder, "RegenReport", "Electric", ragg, scen + ".gdx")
-enduse_folder = os.path.join(main_folder, "RegenData", "elec", ragg, "endusescen")
-# Get regions in California
-cal_r = load_gdx_symbol(model_results_path, "cal_r").r.values
+@pipeline.node(symbols={"reporting": ["gencaprpt"]})
+def gencap():
+    # Generation and capacity from RegenReport, by tech, region, unit, and year
+    gencap = (load_source("reporting", "gencaprpt")
+              .rename(columns = {"uni_0":"region", "grc_1": "type", "t_2": "year", "uni_3": "unit"})
+    )
+    gencap["tech"] = map_unique(gencap["type"], lambda x: TYPE_TO_TECH.get(re.sub(r'\d+', '', x), np.nan), "report type")
+    return (gencap[gencap["tech"].notnull()]
+            .groupby(["tech", "region", "unit", "year"], observed=True)
+            .agg({"value": "sum"})
+            .reset_index()
+    )
 
 # __________________________________________
 
-# Capital Costs
-capcosts = (
-    # Load data from gdx
-    load_gdx_symbol(model_results_path, "capcost")
-    # Rename columns
-        .rename(columns=COLUMN_NAMES)
-    # Add tech column
-        .pipe(get_tech, TECH_SET)
-    # Subset regions to california regions
-        .pipe(subset_data, "region", cal_r)
-    # Get mean capital cost by tech and vintage
-        .groupby(['tech', 'vintage'])
-        .agg({"value": "mean"}).reset_index()
-        .rename(columns = {"value": "capcost"})
-    # Convert 2010 dollars to 2024 dollars
-        .pipe(current_dollars, "capcost")
-    # Pivot wider so that each year is a column
-        .pivot_table(index = ['tech'], columns = 'vintage', values = 'capcost').reset_index()
-    # Drop 2020 year (most techs are new so costs start in 2025)
-        .drop(columns = ["2020"], axis = 1)
-        .rename(columns = {"2050+": "2050"})
-)
-
-# capcosts.to_csv(os.path.join(output_folder, "capcosts_usd2024.csv"), index = False)
-
-# Storage capital costs
-capcost_storage_power = (
-    load_gdx_symbol(model_results_path, "icg")
-    .rename(columns = COLUMN_NAMES))
-capcost_storage_power = capcost_storage_power[capcost_storage_power['tech_class'] == "li-ion"]
-capcost_storage_power['tech_class'] = "li-ion-power"
-
-capcost_storage_energy = load_gdx_symbol(model_results_path, "irg").rename(columns = COLUMN_NAMES)
-capcost_storage_energy = capcost_storage_energy[capcost_storage_energy['tech_class']=="li-ion"]
-capcost_storage_energy['tech_class'] = "li-ion-energy"
-# combine power (size of inverter) and energy (size of battery) into single table
-capcost_storage = (pd.concat([capcost_storage_power, capcost_storage_energy], axis=0, ignore_index=True)
-                    .rename(columns={"tech_class": "tech", "value": "capcost"})
-                    .pipe(current_dollars, "capcost")
-                    .pivot_table(index = ['tech'], columns = 'year', values = 'capcost')
-                    .reset_index()
-)
-
-pd.concat([capcosts, capcost_storage]).to_csv(os.path.join(output_folder, "capcosts_usd2024.csv"), index = False)
+@pipeline.output(symbols={"model": ["capcost", "icg", "irg"]})
+def capcosts_usd2024(cal_r):
+    # Capital Costs
+    capcosts = (
+        # Load data from gdx
+        # Load california regions from gdx
+        load_source("model", "capcost", where={"r": cal_r})
+        # Rename columns
+            .rename(columns=COLUMN_NAMES)
+        # Add tech column
+            .pipe(get_tech, TECH_SET)
+        # Get mean capital cost by tech and vintage
+            .groupby(['tech', 'vintage'], observed=True)
+            .agg({"value": "mean"}).reset_index()
+            .rename(columns = {"value": "capcost"})
+        # Convert 2010 dollars to 2024 dollars
+            .pipe(current_dollars, "capcost")
+        # Pivot wider so that each year is a column
+            .pivot_table(index = ['tech'], columns = 'vintage', values = 'capcost', observed=True).reset_index()
+        # Drop 2020 year (most techs are new so costs start in 2025)
+            .drop(columns = ["2020"], axis = 1, errors = "ignore")
+            .rename(columns = {"2050+": "2050"})
+    )
+
+    # capcosts.to_csv(os.path.join(output_folder, "capcosts_usd2024.csv"), index = False)
+
+    # Storage capital costs
+    capcost_storage_power = (
+        load_source("model", "icg")
+        .rename(columns = COLUMN_NAMES))
+    capcost_storage_power = capcost_storage_power[capcost_storage_power['tech_class'] == "li-ion"]
+    capcost_storage_power['tech_class'] = "li-ion-power"
+
+    capcost_storage_energy = load_source("model", "irg").rename(columns = COLUMN_NAMES)
+    capcost_storage_energy = capcost_storage_energy[capcost_storage_energy['tech_class']=="li-ion"]
+    capcost_storage_energy['tech_class'] = "li-ion-energy"
+    # combine power (size of inverter) and energy (size of battery) into single table
+    capcost_storage = (pd.concat([capcost_storage_power, capcost_storage_energy], axis=0, ignore_index=True)
+                        .rename(columns={"tech_class": "tech", "value": "capcost"})
+                        .pipe(current_dollars, "capcost")
+                        .pivot_table(index = ['tech'], columns = 'year', values = 'capcost', observed=True)
+                        # Years are integers, vintages are labels: name the year columns like the vintage columns
+                        .rename(columns = str)
+                        .reset_index()
+    )
+    return pd.concat([capcosts, capcost_storage])
+
 # _____________________________________________________________
 # FOM and variable costs
-fomcosts = (
-    # Load data from gdx
-    load_gdx_symbol(model_results_path, "fomcost")
-    # Rename columns
-        .rename(columns=COLUMN_NAMES)
-    # Add tech column
-        .pipe(get_tech, TECH_SET)
-    # Subset regions to california regions
-        .pipe(subset_data, "region", cal_r)
-    # Get mean fom cost by tech and vintage
-        .groupby(['tech', 'vintage'])
-        .agg({"value": "mean"}).reset_index()
-        .rename(columns = {"value": "fomcost"})
-    # Convert 2010 dollars to 2024 dollars
-        .pipe(current_dollars, "fomcost")
-    # Pivot wider so that each year is a column
-        .pivot_table(index = ['tech'], columns = 'vintage', values = 'fomcost').reset_index()
-    # Drop 2020 year (most techs are new, so costs start in 2025)
-        .drop(columns = ["2020"], axis = 1)
-)
-fomcosts.to_csv(os.path.join(output_folder, "fom_costs_usd2024.csv"), index = False)
+@pipeline.output(symbols={"model": ["fomcost"]})
+def fom_costs_usd2024(cal_r):
+    return (
+        # Load california regions from gdx
+        load_source("model", "fomcost", where={"r": cal_r})
+        # Rename columns
+            .rename(columns=COLUMN_NAMES)
+        # Add tech column
+            .pipe(get_tech, TECH_SET)
+        # Get mean fom cost by tech and vintage
+            .groupby(['tech', 'vintage'], observed=True)
+            .agg({"value": "mean"}).reset_index()
+            .rename(columns = {"value": "fomcost"})
+        # Convert 2010 dollars to 2024 dollars
+            .pipe(current_dollars, "fomcost")
+        # Pivot wider so that each year is a column
+            .pivot_table(index = ['tech'], columns = 'vintage', values = 'fomcost', observed=True).reset_index()
+        # Drop 2020 year (most techs are new, so costs start in 2025)
+            .drop(columns = ["2020"], axis = 1, errors = "ignore")
+    )
+
 # Generation marginal costs $/MWh
-marginal_cost = (
-    load_gdx_symbol(model_results_path, "icost")
-        .rename(columns=COLUMN_NAMES)
-        .pipe(subset_data, "region", cal_r)
-        .pipe(get_tech, TECH_SET)
-        .groupby(['tech', 'vintage'])
-        .agg({"value": "mean"}).reset_index()
-        .pipe(current_dollars, "value")
-        .rename(columns={"value": "marginal_cost"})
-)
-marginal_cost.to_csv(os.path.join(output_folder, "marginal_costs_usd2024.csv"), index = False)
+@pipeline.output(symbols={"model": ["icost"]})
+def marginal_costs_usd2024(cal_r):
+    return (
+        load_source("model", "icost", where={"r": cal_r})
+            .rename(columns=COLUMN_NAMES)
+            .pipe(get_tech, TECH_SET)
+            .groupby(['tech', 'vintage'], observed=True)
+            .agg({"value": "mean"}).reset_index()
+            .pipe(current_dollars, "value")
+            .rename(columns={"value": "marginal_cost"})
+    )
+
 # _____________________________________________________________
 # CO2 Emissions, measured in million metric tons
-emissions_elec = (load_gdx_symbol(model_results_path, "CO2_ELEC")
-                  .rename(columns={"r": "region", "t": "year", "level": "emissions"}))
+@pipeline.output(symbols={"model": ["CO2_ELEC"]})
+def regional_emissions_mtco2(cal_r):
+    emissions_elec = (load_source("model", "CO2_ELEC")
+                      .rename(columns={"r": "region", "t": "year", "level": "emissions"}))
 
-emissions_elec["emissions"] = emissions_elec["emissions"] * 1000
-# Calculate total emissions for all regions in California
-emissions_california = (emissions_elec[emissions_elec['region'].isin(cal_r)]
-                        .groupby(["year"]).agg({"emissions": "sum"})
-                        .reset_index())
-emissions_california["region"] = "California"
+    emissions_elec["emissions"] = emissions_elec["emissions"] * 1000
+    # Regions and total emissions for all regions in California
+    levels = rollup(emissions_elec, ["region", "year"], {"emissions": "sum"},
+                    region_levels(["region", "california"], cal_r), grouped=True)
 
-emissions_elec = (pd.concat([emissions_elec, emissions_california], axis=0, ignore_index=True)
-    .pivot_table(index = ['region'], columns = 'year', values = 'emissions').reset_index())
+    return (pd.concat(levels.values(), axis=0, ignore_index=True)
+        .pipe(to_wide, "year", "emissions"))
 
-emissions_elec.to_csv(os.path.join(output_folder, "regional_emissions_mtco2.csv"), index = False)
 # _____________________________________________________________
 # Generator and Storage capacity
-storage_capacity = (load_gdx_symbol(model_results_path, "GC")
-                    .rename(columns=COLUMN_NAMES)
-                    .groupby(["region", "year"])
-                    .agg({"level": "sum"})
-                    .reset_index()
-                    .rename(columns={"level": "capacity"})
-                    .pipe(add_tech, "Storage-capacity")
-                    )
-
-storage_energy = (load_gdx_symbol(model_results_path, "GR")
-                    .rename(columns=COLUMN_NAMES)
-                    .groupby(["region", "year"])
-                    .agg({"level": "sum"})
-                    .reset_index()
-                    .rename(columns={"level": "capacity"})
-                    .pipe(add_tech, "Storage-energy")
-                    )
-
-
-capacity = (load_gdx_symbol(model_results_path, symbol="XC")
-            .rename(columns=COLUMN_NAMES).rename(columns={"level": "capacity"})
-            )
+@pipeline.output(symbols={"model": ["GC", "GR"]})
+def capacity_by_region_gw(capacity):
+    storage_capacity = (load_source("model", "GC")
+                        .rename(columns=COLUMN_NAMES)
+                        .groupby(["region", "year"], observed=True)
+                        .agg({"level": "sum"})
+                        .reset_index()
+                        .rename(columns={"level": "capacity"})
+                        .pipe(add_tech, "Storage-capacity")
+                        )
 
-agg_capacity = (capacity
-        # Aggregate vintages and tech classes
-        .pipe(get_tech, TECH_SET)
-        .groupby(["tech", "region", "year"])
-        .agg({"capacity": "sum"})
-        .reset_index()
-)
-
-cap_with_storage = pd.concat([agg_capacity, storage_capacity, storage_energy])
-cap_with_storage.to_csv(os.path.join(output_folder, "capacity_by_region_gw.csv"), index = False)
-
-ca_capacity = (cap_with_storage
-               .pipe(subset_data, "region", cal_r)
-               .groupby(["tech", "year"])
-               .agg({"capacity": "sum"})
-               .reset_index()
-)
-ca_capacity.to_csv(os.path.join(output_folder, "ca_capacity.csv"), index = False)
-# _____________________________________________________________
-# Generator and Storage Investments
-storage_cap_investment = (load_gdx_symbol(model_results_path, "IGC")
-                    .rename(columns=COLUMN_NAMES)
-                    .groupby(["region", "year"])
-                    .agg({"level": "sum"})
-                    .reset_index()
-                    .rename(columns={"level": "investment"})
-                    .pipe(add_tech, "Storage-capacity")
-                    )
-storage_cap_investment = storage_cap_investment[storage_cap_investment["year"] != 2020]
-# Adds all types of storage investments
-storage_energy_investment = (load_gdx_symbol(model_results_path, "IGR")
-                    .rename(columns=COLUMN_NAMES)
-                    .groupby(["region", "year"])
-                    .agg({"level": "sum"})
-                    .reset_index()
-                    .rename(columns={"level": "investment"})
-                    .pipe(add_tech, "Storage-energy")
-                    )
-storage_energy_investment = storage_energy_investment[storage_energy_investment["year"] != 2020]
-
-investment = (load_gdx_symbol(model_results_path, symbol="IX")
-            .rename(columns=COLUMN_NAMES).rename(columns={"level": "investment"})
-            # Aggregate vintages
-            .groupby(["tech_class", "region", "year"])
-            .agg({"investment": "sum"})
-            .reset_index()
+    storage_energy = (load_source("model", "GR")
+                        .rename(columns=COLUMN_NAMES)
+                        .groupby(["region", "year"], observed=True)
+                        .agg({"level": "sum"})
+                        .reset_index()
+                        .rename(columns={"level": "capacity"})
+                        .pipe(add_tech, "Storage-energy")
+                        )
+
+    agg_capacity = (capacity
+            # Aggregate vintages and tech classes
             .pipe(get_tech, TECH_SET)
-            .groupby(["tech", "region", "year"])
-            .agg({"investment": "sum"})
+            .groupby(["tech", "region", "year"], observed=True)
+            .agg({"capacity": "sum"})
             .reset_index()
-)
-
-investment_with_storage = pd.concat([investment, storage_cap_investment, storage_energy_investment])
-investment_with_storage.to_csv(os.path.join(output_folder, "investment_by_region_gw.csv"), index = False)
-
-ca_investment = (investment_with_storage
-               .pipe(subset_data, "region", cal_r)
-               .groupby(["tech", "year"])
-               .agg({"investment": "sum"})
-               .reset_index()
-)
-ca_investment.to_csv(os.path.join(output_folder, "ca_investment.csv"), index = False)
-#______________________________________________________
+    )
 
-# Hourly mapping and segment mapping for load and availability factors
+    return pd.concat([agg_capacity, storage_capacity, storage_energy])
 
-year_list = [2020, 2025, 2030, 2035, 2040, 2045, 2050]
-hour_folder = os.path.join(main_folder, "RegenHours", ragg, "default", "out")
-rep_hours = (
-    pd.concat([load_gdx_symbol(os.path.join(hour_folder, f"create_hrep_{year}_default.gdx"), "hrep") for year in year_list])
-    .rename(columns={"s":"segment","t": "year"})
+@pipeline.output()
+def ca_capacity(capacity_by_region_gw, cal_r):
+    return (rollup(capacity_by_region_gw, ["tech", "region", "year"], {"capacity": "sum"},
+                   region_levels(["california"], cal_r), grouped=True)["california"]
+            .drop(columns="region")
     )
 
-# Hourly load for California
-h_load = (load_gdx_symbol(os.path.join(enduse_folder, f"segdata_8760_default.gdx"), "load_s")
-          .rename(columns = COLUMN_NAMES).rename(columns = {"value":"load_h"})
-        #   Get only CA regions
-          .pipe(subset_data, "region", cal_r)
-          .groupby(["year", "hour"])
-          .agg({"load_h": "sum"})
-          .reset_index()
-          )
-
-s_load = (load_gdx_symbol(os.path.join(enduse_folder, f"segdata_100_default.gdx"), "load_s")
-          .rename(columns = COLUMN_NAMES).rename(columns = {"value":"load_s"})
-        #   Get only CA regions
-          .pipe(subset_data, "region", cal_r)
-          .groupby(["year", "segment"])
-          .agg({"load_s": "sum"})
-          .reset_index()
-          )
-
-hydrogen_loads = (load_gdx_symbol(report_path, "dspsrpt_r")
-                  .rename(columns = {"uni_0": "group", "s_1": "segment", "r_2": "region", "uni_3": "type", "t_4": "year", "value": "hydrogen_load"})
-                  .pipe(subset_data, "group", ["demand"])
-                  .pipe(subset_data, "type", ["h2prod_ht", "h2prod_ne", "h2prod_pa", "h2stortrn"])
-                  .pipe(subset_data, "region", cal_r)
-                  .groupby(["year", "segment"])
-                  .agg({"hydrogen_load": "sum"})
-                  .reset_index()
-)
-loads = (rep_hours
-        .merge(h_load, on = ["year", "hour"]).rename(columns = {"load_h": "load_hour"})
-        .merge(s_load, on = ["year", "segment"]).rename(columns = {"load_s": "load_segment"})
-        .merge(hydrogen_loads, on = ["year", "segment"])
-)
-loads.to_csv(os.path.join(output_folder, "ca_loads.csv"), index = False)
-
-af_h = (load_gdx_symbol(os.path.join(enduse_folder, f"segdata_8760_default.gdx"), "vrsc")
-        .rename(columns={"h": "hour", "uni": "tech_class", "v": "vintage",
-                         "r": "region", "t": "year", "value": "af_h"})
-        .pipe(subset_data, "region", cal_r)
-        .pipe(get_tech, TECH_SET)
-        .merge(capacity, on = ["tech_class", "vintage", "region", "year"])
-        # Keep only rows where tech is in renewable energy sub list
-        .pipe(subset_data, "tech", RE_TECH)
-        # # Add hourly generation as capacity * availability factor
-        .pipe(lambda x: x.assign(generation_h = x.capacity * x.af_h))
-        .assign(af_h_base = lambda x: x["af_h"])
-        .groupby(["tech", "year", "hour"])
-        .agg({"generation_h": "sum", "capacity": "sum", "af_h_base": "mean"})
-        .reset_index()
-        # Get average availability factor
-        .pipe(lambda x: x.assign(af_h = x.generation_h / x.capacity))
-        # Replace NaN values in af_h with af_h_base
-        )
-af_h["af_h"] = af_h["af_h"].fillna(af_h["af_h_base"])
-af_h = af_h.drop(columns="af_h_base", axis=1)
-
-af_s = (load_gdx_symbol(os.path.join(enduse_folder, f"segdata_100_default.gdx"), "vrsc")
-        .rename(columns={"s": "segment", "uni": "tech_class", "v": "vintage",
-                         "r": "region", "t": "year", "value": "af_s"})
-        .pipe(subset_data, "region", cal_r)
-        .pipe(get_tech, TECH_SET)
-        .merge(capacity, on = ["tech_class", "vintage", "region", "year"])
-        # Add hourly generation as capacity * availability factor
-        .pipe(lambda x: x.assign(generation_s = x.capacity * x.af_s))
-        .assign(af_s_base = lambda x: x["af_s"])
-        .groupby(["tech", "year", "segment"])
-        .agg({"generation_s": "sum", "capacity": "sum", "af_s_base": "mean"})
-        .reset_index()
-        # Get average availability factor
-        .pipe(lambda x: x.assign(af_s = x.generation_s / x.capacity))
-        # Keep only rows where tech is in renewable energy sub list
-        .pipe(subset_data, "tech", RE_TECH)
-        .drop(columns="capacity", axis=1)
-        )
-af_s["af_s"] = af_s["af_s"].fillna(af_s["af_s_base"])
-af_s = af_s.drop(columns="af_s_base", axis=1)
-# Merge all dataframes
-df = (
-    af_h
-    .merge(rep_hours, on = ["year", "hour"])
-    .merge(af_s, on = ["year", "segment", "tech"])
-    .merge(h_load, on = ["year", "hour"])
-    .merge(s_load, on = ["year", "segment"])
-    .merge(hydrogen_loads, on = ["year", "segment"])
-    .drop_duplicates()
+# _____________________________________________________________
+# Generator and Storage Investments
+@pipeline.output(symbols={"model": ["IGC", "IGR", "IX"]})
+def investment_by_region_gw():
+    storage_cap_investment = (load_source("model", "IGC")
+                        .rename(columns=COLUMN_NAMES)
+                        .groupby(["region", "year"], observed=True)
+                        .agg({"level": "sum"})
+                        .reset_index()
+                        .rename(columns={"level": "investment"})
+                        .pipe(add_tech, "Storage-capacity")
+                        )
+    storage_cap_investment = storage_cap_investment[storage_cap_investment["year"] != 2020]
+    # Adds all types of storage investments
+    storage_energy_investment = (load_source("model", "IGR")
+                        .rename(columns=COLUMN_NAMES)
+                        .groupby(["region", "year"], observed=True)
+                        .agg({"level": "sum"})
+                        .reset_index()
+                        .rename(columns={"level": "investment"})
+                        .pipe(add_tech, "Storage-energy")
+                        )
+    storage_energy_investment = storage_energy_investment[storage_energy_investment["year"] != 2020]
+
+    investment = (load_source("model", "IX")
+                .rename(columns=COLUMN_NAMES).rename(columns={"level": "investment"})
+                # Aggregate vintages
+                .groupby(["tech_class", "region", "year"], observed=True)
+                .agg({"investment": "sum"})
+                .reset_index()
+                .pipe(get_tech, TECH_SET)
+                .groupby(["tech", "region", "year"], observed=True)
+                .agg({"investment": "sum"})
+                .reset_index()
     )
-df["af_s"] = df["af_s"].fillna(0)
-df["af_h"] = df["af_h"].fillna(0)
-df.to_csv(os.path.join(output_folder, "ca_hourly_mapping.csv"), index = False)
+
+    return pd.concat([investment, storage_cap_investment, storage_energy_investment])
+
+@pipeline.output()
+def ca_investment(investment_by_region_gw, cal_r):
+    return (rollup(investment_by_region_gw, ["tech", "region", "year"], {"investment": "sum"},
+                   region_levels(["california"], cal_r), grouped=True)["california"]
+            .drop(columns="region")
+    )
+
 #______________________________________________________
-TYPE_TO_TECH = {"xnuc": "Nuclear", "nnuc": "Nuclear", "nuca": "Nuclear",
-                "geot": "Geothermal", "hydr": "Hydro", "bioe": "Bio", "othc": "Bio", "h2": "Hydrogen",
-                "becs": "Bio CCS", "xcol": "Coal", "ncol": "Coal", "clcs": "Coal CCS",
-                "xngc": "Gas-CC", "nngc": "Gas-CC", "ngcs": "Gas CCS", "xngp": "Gas-CT", "nngp": "Gas-CT", "dfcap": "Gas-CT",
-                "ptpk": "Gas-CT", "h2cc": "Hydrogen", "xwnd": "Wind", "nwnd": "Wind",
-                "wnos": "Wind", "xspv": "Solar", "nspv": "Solar", "xcsp": "Solar",
-                "ncsp": "Solar", "stor": "Storage", "rfpv": "Solar", "peakload": "Peak Load"}
+# Hourly mapping and segment mapping for load and availability factors
+
+@pipeline.output()
+def ca_loads(rep_hours, h_load, s_load, hydrogen_loads):
+    return (rep_hours
+            .merge(h_load, on = ["year", "hour"]).rename(columns = {"load_h": "load_hour"})
+            .merge(s_load, on = ["year", "segment"]).rename(columns = {"load_s": "load_segment"})
+            .merge(hydrogen_loads, on = ["year", "segment"])
+    )
+
+@pipeline.output()
+def ca_hourly_mapping(hourly_generation, segment_generation, rep_hours, h_load, s_load, hydrogen_loads):
+    chunks = hourly_mapping_chunks(hourly_generation, segment_generation, rep_hours, h_load, s_load, hydrogen_loads)
+    if stream_hourly:
+        # Written one chunk at a time, see write_output_file
+        return chunks
+    return pd.concat(chunks, ignore_index=True)
+
+# Availability factors of California regions and tech classes in the renewable energy sub list
+@cached_input({"segdata_8760": ["vrsc"]})
+def hourly_vrsc(cal_r):
+    return load_source("segdata_8760", "vrsc", where=segdata_where("vrsc", cal_r))
 
-gencap = (load_gdx_symbol(reporting_results_path, "gencaprpt")
-          .rename(columns = {"uni_0":"region", "grc_1": "type", "t_2": "year", "uni_3": "unit"})
-)
-gencap["tech"] = (gencap["type"]
-                  .str.replace(r'\d+', '', regex=True)
-                  .map(TYPE_TO_TECH)
-)
-gencap = (gencap[gencap["tech"].notnull()]
-          .groupby(["tech", "region", "unit", "year"])
-          .agg({"value": "sum"})
-          .reset_index()
-)
-generation = gencap[gencap["unit"] == "TWh"]
-generation.to_csv(os.path.join(output_folder, "generation_twh.csv"), index = False)
-cap = gencap[gencap["unit"] == "gw"]
-cap.to_csv(os.path.join(output_folder, "capacity_gw.csv"), index = False)
+@cached_input({"segdata_100": ["vrsc"]})
+def segment_vrsc(cal_r):
+    return load_source("segdata_100", "vrsc", where=segdata_where("vrsc", cal_r))
+
+@pipeline.node(symbols={"segdata_8760": ["vrsc"]})
+def hourly_generation(capacity, cal_r):
+    """
+    Hourly generation, capacity and average availability factor of each renewable tech in California. The availability
+    factors are aggregated one year at a time so the hourly vrsc records are never merged with capacity all at once.
+    """
+    vrsc_h = hourly_vrsc(cal_r)
+    af_h = chunked_groupby(
+        (chunk
+            .rename(columns={"h": "hour", "uni": "tech_class", "v": "vintage",
+                             "r": "region", "t": "year", "value": "af_h"})
+            .pipe(get_tech, TECH_SET)
+            .pipe(schema.merge, capacity, on = ["tech_class", "vintage", "region", "year"])
+            # # Add hourly generation as capacity * availability factor
+            .pipe(lambda x: x.assign(generation_h = x.capacity * x.af_h))
+            .assign(af_h_base = lambda x: x["af_h"])
+         for _, chunk in vrsc_h.groupby("t", observed=True, sort=False)),
+        ["tech", "year", "hour"],
+        {"generation_h": "sum", "capacity": "sum", "af_h_base": "mean"})
+    del vrsc_h
+    check_rss("ca_hourly_mapping hourly availability factors")
+    # Get average availability factor
+    af_h = af_h.assign(af_h = af_h.generation_h / af_h.capacity)
+    # Replace NaN values in af_h with af_h_base
+    af_h["af_h"] = af_h["af_h"].fillna(af_h["af_h_base"])
+    return af_h.drop(columns="af_h_base", axis=1)
+
+@pipeline.node(symbols={"segdata_100": ["vrsc"]})
+def segment_generation(capacity, cal_r):
+    """
+    Segment generation and average availability factor of each renewable tech in California.
+    """
+    vrsc_s = segment_vrsc(cal_r)
+    af_s = (chunked_groupby(
+        (chunk
+            .rename(columns={"s": "segment", "uni": "tech_class", "v": "vintage",
+                             "r": "region", "t": "year", "value": "af_s"})
+            .pipe(get_tech, TECH_SET)
+            .pipe(schema.merge, capacity, on = ["tech_class", "vintage", "region", "year"])
+            # Add hourly generation as capacity * availability factor
+            .pipe(lambda x: x.assign(generation_s = x.capacity * x.af_s))
+            .assign(af_s_base = lambda x: x["af_s"])
+         for _, chunk in vrsc_s.groupby("t", observed=True, sort=False)),
+        ["tech", "year", "segment"],
+        {"generation_s": "sum", "capacity": "sum", "af_s_base": "mean"})
+            # Get average availability factor
+            .pipe(lambda x: x.assign(af_s = x.generation_s / x.capacity))
+            .drop(columns="capacity", axis=1)
+            )
+    del vrsc_s
+    af_s["af_s"] = af_s["af_s"].fillna(af_s["af_s_base"])
+    return af_s.drop(columns="af_s_base", axis=1)
+
+def hourly_mapping_chunks(af_h, af_s, rep_hours, h_load, s_load, hydrogen_loads):
+    """
+    Build ca_hourly_mapping one renewable tech at a time, in the row order of the full table, from hourly_generation
+    (af_h) and segment_generation (af_s). Each table joined to the hourly factors is indexed once by keys that identify
+    a single row, so the joins cannot duplicate rows and the result does not need drop_duplicates.
+    """
+    # Tables joined to the hourly factors, indexed by their join keys
+    joins = [
+        (["year", "hour"], unique_keys(rep_hours, ["year", "hour"], "hrep")),
+        (["year", "segment", "tech"], unique_keys(af_s, ["year", "segment", "tech"], "segment availability factors")),
+        (["year", "hour"], unique_keys(h_load, ["year", "hour"], "hourly load")),
+        (["year", "segment"], unique_keys(s_load, ["year", "segment"], "segment load")),
+        (["year", "segment"], unique_keys(hydrogen_loads, ["year", "segment"], "hydrogen load")),
+    ]
+    # af_h is sorted by tech, so the chunks come out in the order of the full table
+    for tech, chunk in af_h.groupby("tech", sort=False):
+        df = chunk
+        for keys, table in joins:
+            df = join_unique(df, table, keys)
+        df["af_s"] = df["af_s"].fillna(0)
+        df["af_h"] = df["af_h"].fillna(0)
+        check_rss(f"ca_hourly_mapping ({tech})")
+        yield df
+
+#______________________________________________________
+@pipeline.output()
+def generation_twh(gencap):
+    return gencap[gencap["unit"] == "TWh"]
+
+@pipeline.output()
+def capacity_gw(gencap):
+    return gencap[gencap["unit"] == "gw"]
 
 #______________________________________________________
 # Dispatch values
+@pipeline.node(symbols={"model": ["G", "GD", "X", "X_45V"]})
+def segment_dispatch(cal_r):
+    ca_years = {"r": cal_r, "t": model_years()}
+    storage_charge = (load_source("model", "G", where=ca_years)
+                      .rename(columns = COLUMN_NAMES)
+                      .groupby(["year", "segment"], observed=True)
+                      .agg({"level": "sum"})
+                      .reset_index()
+                      .pipe(add_tech, "Storage-charge"))
 
-storage_charge = (load_gdx_symbol(model_results_path, "G")
-                  .rename(columns = COLUMN_NAMES)
-                  .pipe(subset_data, "region", cal_r)
-                  .groupby(["year", "segment"])
-                  .agg({"level": "sum"})
-                  .reset_index()
-                  .pipe(add_tech, "Storage-charge"))
-
-storage_discharge = (load_gdx_symbol(model_results_path, "GD")
-                  .rename(columns = COLUMN_NAMES)
-                  .pipe(subset_data, "region", cal_r)
-                  .groupby(["year", "segment"])
-                  .agg({"level": "sum"})
-                  .reset_index()
-                  .pipe(add_tech, "Storage-discharge"))
-
-
-gen_dispatch = (pd.concat([load_gdx_symbol(model_results_path, "X"), load_gdx_symbol(model_results_path, "X_45V")])
-            .rename(columns = COLUMN_NAMES)
-            .pipe(subset_data, "region", cal_r)
-            .pipe(get_tech, TECH_SET)
-            .groupby(["tech", "year", "segment"])
-            .agg({"level": "sum"})
-            .reset_index())
+    storage_discharge = (load_source("model", "GD", where=ca_years)
+                      .rename(columns = COLUMN_NAMES)
+                      .groupby(["year", "segment"], observed=True)
+                      .agg({"level": "sum"})
+                      .reset_index()
+                      .pipe(add_tech, "Storage-discharge"))
 
-dispatch = pd.concat([gen_dispatch, storage_charge, storage_discharge]).merge(rep_hours, on = ["year", "segment"])
 
-dispatch.to_csv(os.path.join(output_folder, "dispatch_by_segment_gwh.csv"), index = False)
+    gen_dispatch = (pd.concat([load_source("model", "X", where=ca_years), load_source("model", "X_45V", where=ca_years)])
+                .rename(columns = COLUMN_NAMES)
+                .pipe(get_tech, TECH_SET)
+                .groupby(["tech", "year", "segment"], observed=True)
+                .agg({"level": "sum"})
+                .reset_index())
 
-STATE_MAPPING = {'BANC_TID': "ca", 'IID': "ca", 'LDWP': "ca", 'Other': "ca", 'PGE':"ca", 'SCE': "ca", 'SDGE': "ca",
-                 'Oregon': "rest_of_wecc", 'Washington': "rest_of_wecc", 'Nevada': "rest_of_wecc", 'Arizona': "rest_of_wecc",
-                 'New_Mexico': "rest_of_wecc", 'Utah': "rest_of_wecc", 'Colorado': "rest_of_wecc", 'Idaho': "rest_of_wecc",
-                 'Montana': "rest_of_wecc", 'Wyoming': "rest_of_wecc"}
+    return pd.concat([gen_dispatch, storage_charge, storage_discharge])
 
-trade = (load_gdx_symbol(model_results_path, "E")
-         .rename(columns = {"s_0": "segment", "r_1": "region_exp", "r_2": "region_imp", "t_3": "year", "level": "trade_gw"})
-         .pipe(map_col, "region_exp", STATE_MAPPING)
-         .pipe(map_col, "region_imp", STATE_MAPPING)
-         .groupby(["year", "segment", "region_exp", "region_imp"])
-            .agg({"trade_gw": "sum"})
-            .reset_index()
-            .merge(rep_hours, on = ["year", "segment"])
-)
-trade.to_csv(os.path.join(output_folder, "trade_gw.csv"), index = False)
-# ___________________________________
+# rep_hours is optional for SEGMENT_OUTPUTS: with --segment-outputs they are not expanded to hours, so hrep is not read
+@pipeline.output(optional=["rep_hours"])
+def dispatch_by_segment_gwh(segment_dispatch, rep_hours):
+    return expand_to_hours(segment_dispatch, rep_hours)
+
+@pipeline.output(symbols={"model": ["E"]}, optional=["rep_hours"])
+def trade_gw(rep_hours):
+    trade = (load_source("model", "E", where={"t_3": model_years()})
+             .rename(columns = {"s_0": "segment", "r_1": "region_exp", "r_2": "region_imp", "t_3": "year", "level": "trade_gw"}))
+    # Trade between ca and the rest of WECC
+    return (rollup(trade, ["year", "segment", "region_exp", "region_imp"], {"trade_gw": "sum"},
+                   region_levels(["state"]), regions=["region_exp", "region_imp"], report_unmapped=True)["state"]
+            .pipe(expand_to_hours, rep_hours)
+    )
+
+#______________________________________________________
+# Hourly summaries for 3_hour_and_segments.r. Computed on years x hours arrays (see summaries.py), so the figures only
+# read these small tables instead of ca_hourly_mapping and the hourly dispatch.
+
+def re_column(tech: str) -> str:
+    # Column name of a renewable tech, e.g. offshore_wind
+    return tech.lower().replace(" ", "_")
+
+@pipeline.node()
+def hourly_arrays(hourly_generation, segment_generation, rep_hours, h_load, s_load, hydrogen_loads):
+    """
+    California load, net load, and generation, capacity and availability factor of each tech in RE_TECH for every hour,
+    as years x hours arrays at hourly ("hour") and segment ("segment") resolution. Load includes hydrogen production,
+    and net load is load less renewable generation.
+    Returns:
+    YearHourGrid: Years and hours of the arrays.
+    dict: resolution -> {name: array}, e.g. arrays["hour"]["solar_af"].
+    """
+    grid = YearHourGrid(rep_hours, h_load["year"].unique())
+    hydrogen = grid.segment_values(hydrogen_loads, "hydrogen_load")
+    arrays = {"hour": {"load": grid.values(h_load, "load_h") + hydrogen},
+              "segment": {"load": grid.segment_values(s_load, "load_s") + hydrogen}}
+    for tech in RE_TECH:
+        name = re_column(tech)
+        hourly = hourly_generation[hourly_generation["tech"] == tech]
+        segment = segment_generation[segment_generation["tech"] == tech]
+        # Hours without capacity have no availability factor, 0 as in ca_hourly_mapping
+        arrays["hour"][name] = np.nan_to_num(grid.values(hourly, "generation_h"))
+        arrays["hour"][name + "_capacity"] = np.nan_to_num(grid.values(hourly, "capacity"))
+        arrays["hour"][name + "_af"] = np.nan_to_num(grid.values(hourly, "af_h"))
+        arrays["segment"][name] = np.nan_to_num(grid.segment_values(segment, "generation_s"))
+        arrays["segment"][name + "_af"] = np.nan_to_num(grid.segment_values(segment, "af_s"))
+    for values in arrays.values():
+        values["net_load"] = values["load"] - sum(values[re_column(tech)] for tech in RE_TECH)
+    return grid, arrays
+
+@pipeline.output()
+def ca_net_load_gw(hourly_arrays):
+    # Hourly load, renewable generation and net load, with the rank of each hour by net load (1 for the highest)
+    grid, arrays = hourly_arrays
+    hour = arrays["hour"]
+    return grid.frame(**{name: hour[name] for name in ["load"] + [re_column(tech) for tech in RE_TECH] + ["net_load"]},
+                      net_load_rank=descending_rank(hour["net_load"]))
+
+@pipeline.output()
+def net_load_hour_of_day(hourly_arrays):
+    # Average load, net load, solar and wind generation by hour of day, as fractions of the year's peak load
+    grid, arrays = hourly_arrays
+    hour = arrays["hour"]
+    peak = hour["load"].max(axis=1, keepdims=True)
+    groups = hour_of_day(grid.hours)
+    return grid.by_year(np.arange(HOURS_PER_DAY), "hour_of_day",
+                        **{name: group_means(hour[name] / peak, groups, HOURS_PER_DAY)
+                           for name in ["load", "net_load", "solar", "wind"]})
+
+@pipeline.output()
+def net_load_peak_hours(hourly_arrays):
+    # Average load, net load, and renewable generation, capacity and availability factor (type) over the
+    # PEAK_NET_LOAD_HOURS hours of highest net load of each year
+    grid, arrays = hourly_arrays
+    hour = arrays["hour"]
+    peak = descending_rank(hour["net_load"]) <= PEAK_NET_LOAD_HOURS
+
+    def mean(values):
+        # Mean of each year over its peak hours
+        return (values * peak).sum(axis=1) / peak.sum(axis=1)
+
+    return pd.concat([pd.DataFrame({"year": grid.years.astype(np.int16), "type": kind,
+                                    "load": mean(hour["load"]), "net_load": mean(hour["net_load"]),
+                                    **{re_column(tech): mean(hour[re_column(tech) + suffix]) for tech in RE_TECH}})
+                      for kind, suffix in [("af", "_af"), ("capacity", "_capacity"), ("generation", "")]],
+                     ignore_index=True)
+
+@pipeline.output()
+def load_duration_curves(hourly_arrays):
+    # Load, net load, and solar and wind availability factors of each year and resolution (aggregation), each sorted
+    # from highest to lowest. order_hour is the position in the sorted year.
+    grid, arrays = hourly_arrays
+    order = np.arange(1, len(grid.hours) + 1)
+    return pd.concat([grid.by_year(order, "order_hour", {"aggregation": aggregation},
+                                   **{name: duration_curve(values[name])
+                                      for name in ["load", "net_load", "solar_af", "wind_af"]})
+                      for aggregation, values in arrays.items()], ignore_index=True)
+
+@pipeline.output()
+def monthly_load_af(hourly_arrays):
+    # Average load and solar and wind availability factors by month, at each resolution (aggregation)
+    grid, arrays = hourly_arrays
+    groups = month(grid.hours) - 1
+    return pd.concat([grid.by_year(np.arange(1, 13), "month", {"aggregation": aggregation},
+                                   **{name: group_means(values[name], groups, 12)
+                                      for name in ["load", "solar_af", "wind_af"]})
+                      for aggregation, values in arrays.items()], ignore_index=True)
+
+@pipeline.output()
+def net_load_decile_dispatch(segment_dispatch, hourly_arrays):
+    # Average dispatch of each tech in each tenth of the hours of a year ranked by net load, decile NET_LOAD_GROUPS
+    # holding the hours of highest net load
+    grid, arrays = hourly_arrays
+    groups = ntile(descending_rank(arrays["hour"]["net_load"]), NET_LOAD_GROUPS) - 1
+    return pd.concat([grid.by_year(np.arange(1, NET_LOAD_GROUPS + 1), "net_load_decile", {"tech": tech},
+                                   level=group_means(grid.segment_values(dispatch, "level"), groups, NET_LOAD_GROUPS))
+                      for tech, dispatch in segment_dispatch.groupby("tech", observed=True, sort=False)],
+                     ignore_index=True)
+
+@pipeline.output()
+def hour_of_day_dispatch(segment_dispatch, hourly_arrays):
+    # Average dispatch of each tech by hour of day
+    grid, arrays = hourly_arrays
+    groups = hour_of_day(grid.hours)
+    return pd.concat([grid.by_year(np.arange(HOURS_PER_DAY), "hour_of_day", {"tech": tech},
+                                   level=group_means(grid.segment_values(dispatch, "level"), groups, HOURS_PER_DAY))
+                      for tech, dispatch in segment_dispatch.groupby("tech", observed=True, sort=False)],
+                     ignore_index=True)
+
+#____________________________________________
+# Scenario extraction
+
+def source_paths(scen: str = None) -> dict:
+    """
+    GDX file paths for each source used by the pipeline. Scenario specific sources are only included if scen is given.
+    """
+    enduse_folder = os.path.join(main_folder, "RegenData", "elec", ragg, "endusescen")
+    hour_folder = os.path.join(main_folder, "RegenHours", ragg, "default", "out")
+    paths = {
+        "segdata_8760": [os.path.join(enduse_folder, "segdata_8760_default.gdx")],
+        "segdata_100": [os.path.join(enduse_folder, "segdata_100_default.gdx")],
+        "hrep": [os.path.join(hour_folder, f"create_hrep_{year}_default.gdx") for year in year_list],
+    }
+    if scen is not None:
+        paths["model"] = [os.path.join(main_folder, "RegenCases", ragg, scen, "elec", "out", scen + ".elec.gdx")]
+        paths["report"] = [os.path.join(main_folder, "RegenCases", ragg, scen, "elec", "report", scen + ".elec_rpt.gdx")]
+        paths["reporting"] = [os.path.join(main_folder, "RegenReport", "Electric", ragg, scen + ".gdx")]
+    return paths
+
+def output_sources(scen: str = None, outputs: list = None, segments: bool = False) -> dict:
+    """
+    GDX paths and symbols each output is built from. Returns output -> {path: [symbols]}.
+    Only sources available from source_paths(scen) are included. With segments, SEGMENT_OUTPUTS are built without the
+    hour to segment mapping.
+    """
+    paths = source_paths(scen)
+    return {output: {path: sources[key] for key in sources if key in paths for path in paths[key]}
+            for output, sources in ((o, pipeline.sources(o, not segments)) for o in pipeline.outputs())
+            if outputs is None or output in outputs}
+
+def gdx_symbols(sources: dict) -> dict:
+    """
+    Combine output_sources into path -> list of symbols read from that file.
+    """
+    symbols = {}
+    for output_paths in sources.values():
+        for path, names in output_paths.items():
+            symbols.setdefault(path, set()).update(names)
+    return {path: sorted(names) for path, names in symbols.items()}
+
+def shared_input_symbols(outputs: list = None, segments: bool = False) -> dict:
+    """
+    GDX symbols that are the same for every scenario in a regional aggregation: the hour to segment mapping
+    and the endusescen segment data. Returns a dictionary of path -> list of symbols.
+    """
+    return gdx_symbols(output_sources(None, outputs, segments))
+
+def open_input_cache(folder: str = None):
+    """
+    Input cache of the current regional aggregation in folder (see input_cache.py), or None if folder is None.
+    """
+    return InputCache(os.path.join(folder, ragg), TRANSFORM_VERSION) if folder is not None else None
+
+def california_regions(scenarios: list, cache: GdxCache):
+    """
+    California regions (cal_r) of any of scenarios, read from their model GDX files with cache. Returns None if a
+    scenario's cal_r cannot be read, as its regions are then unknown.
+    """
+    regions = set()
+    paths = [path for scen in scenarios for path in source_paths(scen)["model"]]
+    for path in paths:
+        if os.path.exists(path):
+            cache.require(path, ["cal_r"])
+    for path in paths:
+        try:
+            regions.update(cache.get(path, "cal_r")["r"].astype(str))
+        except (OSError, KeyError):
+            return None
+    return regions
+
+def load_shared_inputs(outputs: list = None, profiler=None, reader: str = None, input_cache_folder: str = None,
+                       scenarios: list = None, segments: bool = False) -> dict:
+    """
+    Load the scenario independent symbols needed for outputs once so they can be shared by every scenario in a batch.
+    reader is the GDX reader backend (see gdx_reader.py), by default the fastest available. Symbols already in the
+    input cache in input_cache_folder are left out. The segdata records are filtered as the scenarios filter them (see
+    segdata_where), for the California regions of any of scenarios, so workers are only sent the records they keep.
+    segments is as in output_sources.
+    Returns a dictionary of (path, symbol) -> records.
+    """
+    cache = GdxCache(profiler=profiler, reader=gdx_reader or get_reader(reader))
+    cached = open_input_cache(input_cache_folder)
+    symbols = {path: [name for name in names if cached is None or not cached.covers(path, name)]
+               for path, names in shared_input_symbols(outputs, segments).items() if os.path.exists(path)}
+    symbols = {path: names for path, names in symbols.items() if names}
+    paths = source_paths()
+    segdata = {path for source in ["segdata_8760", "segdata_100"] for path in paths[source] if path in symbols}
+    regions = california_regions(scenarios, cache) if segdata and scenarios else None
+    for path, names in symbols.items():
+        cache.require(path, names)
+
+    def load(path):
+        records = {(path, symbol): cache.get(path, symbol) for symbol in symbols[path]}
+        if path in segdata and regions is not None:
+            records = {key: filter_records(df, segdata_where(key[1], regions)) for key, df in records.items()}
+        return records
+
+    # Each file is read in its own thread (the hrep files are one per year)
+    with ThreadPoolExecutor(min(len(symbols), 8) or 1) as pool:
+        return {key: value for file_records in pool.map(load, symbols) for key, value in file_records.items()}
+
+#____________________________________________
+
+def scenario_folder(scen: str) -> str:
+    return os.path.join(output_root, scen)
+
+def output_store() -> OutputStore:
+    """
+    Consolidated store of the outputs of every scenario, see store.py.
+    """
+    return OutputStore(os.path.join(output_root, STORE_FILE))
+
+def output_layout(output: str, segments: bool = False) -> str:
+    """
+    Layout recorded in the manifest for an output: "segment" for SEGMENT_OUTPUTS written at segment level, otherwise
+    None. Switching --segment-outputs on or off rebuilds them.
+    """
+    return "segment" if segments and output in SEGMENT_OUTPUTS else None
+
+def plan_scenario(scen: str, force: bool = False, outputs: list = None, fmt: str = "csv", partition_by_year: bool = False,
+                  compression: str = None, store: bool = True, segments: bool = False):
+    """
+    Decide which outputs of a scenario need to be rebuilt, using the manifest in its output folder.
+
+    Parameters:
+    scen    (str)            : The scenario name.
+    force   (bool, optional) : Rebuild every output regardless of the manifest. Defaults to False.
+    outputs (list, optional) : Only consider these outputs. Defaults to every output.
+    fmt, partition_by_year, compression : Output format, see write_output_file. An output written in another format
+                                          is rebuilt.
+    store   (bool, optional) : Also rebuild outputs missing from the consolidated store. Defaults to True.
+    segments (bool, optional): Segment outputs are written at segment level. Outputs written the other way are rebuilt.
+    Returns:
+    dict: output -> reason it needs to be rebuilt. Outputs that are up to date are left out.
+    dict: fingerprints of the source files, passed on to extract_scenario so they are not hashed again.
+    """
+    manifest = Manifest(scenario_folder(scen))
+    stored = output_store().outputs(scen) if store and not force else set()
+    plan = {}
+    for output, sources in output_sources(scen, outputs, segments).items():
+        file = output_file(output, fmt, partition_by_year, compression)
+        reason = "forced" if force else manifest.stale_reason(output, file, sources, TRANSFORM_VERSION,
+                                                                    output_layout(output, segments))
+        if reason is None and store and output not in stored:
+            reason = "not in store"
+        if reason is not None:
+            plan[output] = reason
+    return plan, manifest.fingerprints
+
+def extract_scenario(scen: str, shared: dict = None, plan: tuple = None, force: bool = False,
+                     fmt: str = "csv", partition_by_year: bool = False, compression: str = None,
+                     stream: bool = False, max_rss_gb: float = None, store: bool = True, segments: bool = False,
+                     writers: int = 2, max_pending_write_mb: float = 1024, reader: str = None,
+                     input_cache_folder: str = None, profile: bool = False, profile_dump: str = None):
+    """
+    Extract outputs for a single scenario into cleaned_data/<scen>. Only outputs whose GDX inputs or transform version
+    changed since the last run are rebuilt.
+
+    Parameters:
+    scen   (str)            : The scenario name (folder in RegenCases/<ragg>).
+    shared (dict, optional) : Scenario independent records from load_shared_inputs. Loaded from GDX if not given.
+    plan   (tuple, optional): Result of plan_scenario. Computed here if not given.
+    force  (bool, optional) : Rebuild every output. Defaults to False.
+    fmt, partition_by_year, compression : Output format, see write_output_file. Defaults to uncompressed csv files.
+    stream     (bool, optional) : Build and write ca_hourly_mapping one tech at a time. Defaults to False.
+    max_rss_gb (float, optional): Fail if building ca_hourly_mapping uses more memory than this. Defaults to no limit.
+    store      (bool, optional) : Also write the outputs to the consolidated store. Defaults to True.
+    segments   (bool, optional) : Write SEGMENT_OUTPUTS at segment level, without copying each value onto every hour
+                                  of its segment. Expand them with hours.HourIndex and the hour_segments output.
+                                  Defaults to False.
+    writers    (int, optional)  : Threads writing finished outputs while the next are computed. 0 writes each output
+                                  before moving on. Defaults to 2.
+    max_pending_write_mb (float, optional): Memory of the outputs waiting to be written above which computing waits
+                                  for the writers. Defaults to 1024 MB; None for no limit.
+    reader     (str, optional)  : GDX reader backend, numpy or transfer (see gdx_reader.py). Defaults to numpy if
+                                  gams.core.numpy is available.
+    input_cache_folder (str, optional): Folder of the cache of scenario independent inputs (see input_cache.py).
+                                  Defaults to None, building them from GDX every time.
+    profile    (bool, optional) : Time each step, GDX read and output write. Defaults to False.
+    profile_dump (str, optional): Folder for cProfile and tracemalloc dumps of the slowest stage. Implies profile.
+    Returns:
+    dict: The profiling report of the scenario (see profiling.py), or None if not profiled.
+    """
+    global gdx_cache, scenario_paths, stream_hourly, hourly_rss_limit_gb, input_cache, profiler
+    profiler = Profiler(scen, profile_dump) if profile or profile_dump else None
+    gdx_cache = GdxCache(shared=shared, profiler=profiler, reader=gdx_reader or get_reader(reader))
+    stream_hourly = stream
+    hourly_rss_limit_gb = max_rss_gb
+    input_cache = open_input_cache(input_cache_folder)
+    output_folder = scenario_folder(scen)
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    rebuild, fingerprints = plan if plan is not None else plan_scenario(scen, force, None, fmt, partition_by_year,
+                                                                        compression, store, segments)
+    if not rebuild:
+        print(f"{scen}: all outputs up to date")
+        return profiler.report() if profiler else None
+    outputs = set(rebuild)
+    manifest = Manifest(output_folder, fingerprints)
+    sources = output_sources(scen, outputs, segments)
+    # Outputs are written and recorded in the manifest from several threads
+    manifest_lock = threading.Lock()
+
+    def write_output(name: str, df: pd.DataFrame):
+        """
+        Write an output to the scenario folder and the consolidated store, and record it in the manifest.
+        """
+        if profiler is None:
+            if store:
+                df = output_store().writer(scen, name, df)
+            file = write_output_file(df, output_folder, name, fmt, partition_by_year, compression)
+        else:
+            with profiler.stage(f"write {name}", "write") as record:
+                df = count_rows(df, record)
+                if store:
+                    df = output_store().writer(scen, name, df)
+                file = write_output_file(df, output_folder, name, fmt, partition_by_year, compression)
+                record["bytes_written"] = path_size(os.path.join(output_folder, file))
+        with manifest_lock:
+            manifest.record(name, file, sources[name], TRANSFORM_VERSION, output_layout(name, segments))
+            manifest.save()
+
+    def queue_output(name: str, df):
+        """
+        Hand a finished output to the writer threads. Outputs built in chunks (see --stream) are written here instead,
+        as building each chunk still reads from the GDX cache, which is only used from this thread.
+        """
+        if isinstance(df, pd.DataFrame):
+            writer_pool.submit(name, write_output, name, df, size=int(df.memory_usage(deep=True).sum()))
+        else:
+            write_output(name, df)
+
+    scenario_paths = source_paths(scen)
+    # Symbols read from each GDX file. Registering them up front lets the cache read each file once.
+    for path, symbols in gdx_symbols(sources).items():
+        gdx_cache.require(path, symbols)
+
+    max_pending_bytes = max_pending_write_mb * 1e6 if max_pending_write_mb is not None else None
+    with WriterPool(writers, max_pending_bytes) as writer_pool:
+        pipeline.run(list(rebuild), queue_output, profiler.call_step if profiler else None, optional=not segments)
+        if profiler is not None:
+            with profiler.stage("wait for writes", "write"):
+                writer_pool.wait()
+
+    print(f"{scen}: {gdx_cache.summary()}" + (f", {input_cache.summary()}" if input_cache is not None else ""))
+    return profiler.report() if profiler else None
+
+#____________________________________________
+# Batch extraction
+
+def select_scenarios(patterns: list) -> list:
+    """
+    Return the scenarios in RegenCases/<ragg> matching any of the names or glob patterns. All scenarios if none are given.
+    """
+    available = sorted(os.listdir(os.path.join(main_folder, "RegenCases", ragg)))
+    if not patterns:
+        return available
+    selected = [s for s in available if any(fnmatch.fnmatch(s, p) for p in patterns)]
+    unmatched = [p for p in patterns if not any(fnmatch.fnmatch(s, p) for s in available)]
+    if unmatched:
+        print(f"No scenarios match {unmatched}. Available scenarios: {available}")
+    return selected
+
+def worker_count(scenarios: list, workers: int, shared: dict, max_memory_gb: float = None, max_rss_gb: float = None) -> int:
+    """
+    Cap the number of workers so that the estimated memory of all workers fits in max_memory_gb,
+    or in the currently available memory if no limit is given. Workers are assumed to stay under max_rss_gb if given.
+    """
+    workers = max(1, min(workers, len(scenarios)))
+    budget = max_memory_gb * 1e9 if max_memory_gb else available_memory()
+    if budget is None:
+        return workers
+    shared_bytes = sum(df.memory_usage(deep=True).sum() for df in shared.values())
+    model_gdx = [source_paths(s)["model"][0] for s in scenarios]
+    gdx_bytes = max([os.path.getsize(p) for p in model_gdx if os.path.exists(p)], default=0)
+    per_worker = shared_bytes + MEMORY_PER_GDX_BYTE * gdx_bytes
+    if max_rss_gb:
+        per_worker = min(per_worker, max_rss_gb * 1e9)
+    memory_workers = max(1, int(budget // per_worker)) if per_worker else workers
+    if memory_workers < workers:
+        print(f"Limiting to {memory_workers} workers (~{per_worker / 1e9:.1f} GB each, {budget / 1e9:.1f} GB available)")
+    return min(workers, memory_workers)
+
+# Scenario independent records, set in each worker process by _init_worker
+_worker_shared = None
+
+def _init_worker(shared: dict):
+    global _worker_shared
+    _worker_shared = shared
+
+def _extract_in_worker(scen: str, plan: tuple, options: dict):
+    return extract_scenario(scen, _worker_shared, plan, **options)
+
+def extract_batch(scenarios: list, workers: int = None, max_memory_gb: float = None,
+                  force: bool = False, dry_run: bool = False, outputs: list = None, **options) -> dict:
+    """
+    Extract several scenarios in parallel. A failing scenario does not stop the others.
+    Scenarios whose outputs are all up to date are skipped.
+
+    Parameters:
+    scenarios     (list)            : Scenario names to extract.
+    workers       (int, optional)   : Maximum number of worker processes. Defaults to the number of CPUs.
+    max_memory_gb (float, optional) : Memory budget for all workers. Defaults to the available memory.
+    force         (bool, optional)  : Rebuild every output regardless of the manifests. Defaults to False.
+    dry_run       (bool, optional)  : Only print which outputs would be rebuilt. Defaults to False.
+    outputs       (list, optional)  : Only extract these outputs. Defaults to every output.
+    options                         : Passed on to extract_scenario: fmt, partition_by_year, compression, stream,
+                                      max_rss_gb, store, segments, writers, max_pending_write_mb, reader,
+                                      input_cache_folder, profile and profile_dump. If profiling, a run report is
+                                      written to cleaned_data/profile_report.json and a summary table is printed.
+    Returns:
+    dict: scenario -> error message for every scenario that failed.
+    """
+    failures = {}
+    plans = {}
+    plan_options = {key: options[key] for key in ("fmt", "partition_by_year", "compression", "store", "segments") if key in options}
+    for scen in scenarios:
+        try:
+            plans[scen] = plan_scenario(scen, force, outputs, **plan_options)
+        except Exception:
+            failures[scen] = traceback.format_exc()
+            print(f"{scen} failed:\n{failures[scen]}")
+            continue
+        rebuild = plans[scen][0]
+        if dry_run or not rebuild:
+            print(f"{scen}: " + (", ".join(f"{o} ({r})" for o, r in rebuild.items()) if rebuild else "all outputs up to date"))
+    todo = [scen for scen in plans if plans[scen][0]]
+    if dry_run or not todo:
+        return failures
+
+    start = time.perf_counter()
+    profiled = options.get("profile") or options.get("profile_dump")
+    reports = []
+    # Loading the shared inputs is profiled as its own scenario
+    shared_profiler = Profiler("shared inputs") if profiled else None
+    shared = load_shared_inputs({o for scen in todo for o in plans[scen][0]}, shared_profiler, options.get("reader"),
+                                options.get("input_cache_folder"), todo, options.get("segments", False))
+    if shared_profiler is not None:
+        reports.append(shared_profiler.report())
+    workers = worker_count(todo, workers or os.cpu_count() or 1, shared, max_memory_gb, options.get("max_rss_gb"))
+    if workers == 1:
+        for scen in todo:
+            try:
+                reports.append(extract_scenario(scen, shared, plans[scen], **options))
+            except Exception:
+                failures[scen] = traceback.format_exc()
+                print(f"{scen} failed:\n{failures[scen]}")
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared,)) as pool:
+            futures = {pool.submit(_extract_in_worker, scen, plans[scen], options): scen for scen in todo}
+            for future in as_completed(futures):
+                scen = futures[future]
+                try:
+                    reports.append(future.result())
+                    print(f"{scen} done")
+                except Exception as e:
+                    failures[scen] = "".join(traceback.format_exception(e))
+                    print(f"{scen} failed:\n{failures[scen]}")
+
+    if profiled:
+        run_report = combine_reports([r for r in reports if r], time.perf_counter() - start)
+        save_report(run_report, os.path.join(output_root, REPORT_FILE))
+        print(summary_table(run_report))
+    return failures
+
+#____________________________________________
+# Scenario comparison
+
+def write_deltas(baseline: str, scenarios: list, metrics: list = None, top: int = None, fmt: str = "csv",
+                 compression: str = None) -> str:
+    """
+    Write the differences of each metric in DELTA_METRICS between scenarios and baseline (see deltas.py), read from the
+    consolidated store, to <output_root>/deltas/<baseline>.
+
+    Parameters:
+    baseline  (str)            : Scenario the others are compared with.
+    scenarios (list)           : Scenarios compared with baseline.
+    metrics   (list, optional) : Only these metrics. Defaults to every metric.
+    top       (int, optional)  : Also write the top largest changes of each metric for each scenario.
+    fmt, compression           : Output format, see write_output_file.
+    Returns:
+    str: The folder the tables were written to.
+    """
+    folder = os.path.join(output_root, "deltas", baseline)
+    os.makedirs(folder, exist_ok=True)
+    tables = scenario_deltas(output_store(), baseline, scenarios, metrics, top)
+    for name, df in tables.items():
+        write_output_file(df, folder, name, fmt, compression=compression)
+    print(f"Wrote {', '.join(tables)} deltas against {baseline} to {folder}")
+    return folder
+
+#____________________________________________
+# Watch mode
+
+def scenario_gdx_patterns() -> list:
+    """
+    Glob patterns of the scenario specific GDX files (model, report and RegenReport) of every scenario.
+    """
+    return [os.path.join(main_folder, "RegenCases", ragg, "*", "elec", "out", "*.elec.gdx"),
+            os.path.join(main_folder, "RegenCases", ragg, "*", "elec", "report", "*.elec_rpt.gdx"),
+            os.path.join(main_folder, "RegenReport", "Electric", ragg, "*.gdx")]
+
+def gdx_scenario(path: str):
+    """
+    Scenario a GDX file from scenario_gdx_patterns belongs to, or None if it is not one of its sources.
+    """
+    name = os.path.basename(path)
+    for suffix in (".elec.gdx", ".elec_rpt.gdx", ".gdx"):
+        if name.endswith(suffix):
+            scen = name[:-len(suffix)]
+            return scen if os.path.abspath(path) in map(os.path.abspath, gdx_paths(scen)) else None
+    return None
+
+def gdx_paths(scen: str) -> list:
+    """
+    GDX paths of every source of a scenario.
+    """
+    return [path for paths in source_paths(scen).values() for path in paths]
+
+def ready_outputs(scen: str, outputs: list = None, segments: bool = False) -> list:
+    """
+    Outputs (of outputs, or all) whose GDX files all exist, e.g. the model outputs before RegenReport has been run.
+    segments is as in output_sources.
+    """
+    return [output for output, sources in output_sources(scen, outputs, segments).items()
+            if all(os.path.exists(path) for path in sources)]
+
+def watch(patterns: list = None, workers: int = 2, outputs: list = None, interval_s: float = 30, settle_s: float = 60,
+          polls: int = None, **options):
+    """
+    Extract scenarios as their GDX files are written, until interrupted. Every scenario is checked when watching
+    starts, so outputs that are out of date are rebuilt first.
+
+    Parameters:
+    patterns   (list, optional) : Scenario names or glob patterns to watch. Defaults to every scenario.
+    workers    (int, optional)  : Scenarios extracted at once. Defaults to 2.
+    outputs    (list, optional) : Only extract these outputs. Defaults to every output.
+    interval_s (float, optional): Seconds between looks for new GDX files. Defaults to 30.
+    settle_s   (float, optional): Seconds a GDX file's size and modification time must stay the same before it is
+                                  used, so files still being written are not read. Defaults to 60.
+    polls      (int, optional)  : Stop after this many looks, once running extractions finish. Defaults to no limit.
+    options                     : Passed on to plan_scenario and extract_scenario, as for extract_batch.
+    Returns:
+    dict: scenario -> error message of the last failed extraction of each scenario that failed.
+    """
+    watcher = Watcher(scenario_gdx_patterns(), settle_s)
+    plan_options = {key: options[key] for key in ("fmt", "partition_by_year", "compression", "store", "segments") if key in options}
+    failures = {}
+    # Scenarios waiting for a worker, in the order they changed. A scenario is only queued once.
+    queued = []
+    running = {}
+    # Scenarios whose files changed while they were being extracted, extracted again when they finish
+    rerun = set()
+    print(f"Watching {main_folder} for new GDX files every {interval_s:g} s. Stop with Ctrl+C.")
+    poll = 0
+    # Shared inputs are read by each worker through the input cache, not sent to the workers
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(None,)) as pool:
+        try:
+            while polls is None or poll < polls:
+                poll += 1
+                for path in watcher.poll():
+                    scen = gdx_scenario(path)
+                    if scen is None or (patterns and not any(fnmatch.fnmatch(scen, p) for p in patterns)):
+                        continue
+                    if scen in running.values():
+                        rerun.add(scen)
+                    elif scen not in queued:
+                        print(f"{scen}: {os.path.basename(path)} changed")
+                        queued.append(scen)
+
+                for future in [f for f in running if f.done()]:
+                    scen = running.pop(future)
+                    try:
+                        future.result()
+                        failures.pop(scen, None)
+                        print(f"{scen} done")
+                    except Exception as e:
+                        failures[scen] = "".join(traceback.format_exception(e))
+                        print(f"{scen} failed:\n{failures[scen]}")
+                    if scen in rerun:
+                        rerun.discard(scen)
+                        queued.append(scen)
+
+                while queued and len(running) < workers:
+                    scen = queued.pop(0)
+                    try:
+                        plan = plan_scenario(scen, False, ready_outputs(scen, outputs, options.get("segments", False)),
+                                             **plan_options)
+                    except Exception:
+                        failures[scen] = traceback.format_exc()
+                        print(f"{scen} failed:\n{failures[scen]}")
+                        continue
+                    if plan[0]:
+                        print(f"{scen}: extracting " + ", ".join(f"{o} ({r})" for o, r in plan[0].items()))
+                        running[pool.submit(_extract_in_worker, scen, plan, options)] = scen
+                    else:
+                        print(f"{scen}: all outputs up to date")
+                if polls is None or poll < polls:
+                    time.sleep(interval_s)
+        except KeyboardInterrupt:
+            print(f"Stopping. Waiting for {len(running)} running extractions to finish.")
+        for future, scen in running.items():
+            try:
+                future.result()
+                print(f"{scen} done")
+            except Exception as e:
+                failures[scen] = "".join(traceback.format_exception(e))
+                print(f"{scen} failed:\n{failures[scen]}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract summary csv files from REGEN results.")
+    parser.add_argument("scenarios", nargs="*",
+                        help=f"Scenario names or glob patterns. Defaults to every scenario in RegenCases/{ragg}.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Maximum number of scenarios extracted in parallel. Defaults to the number of CPUs, or 2 with --watch.")
+    parser.add_argument("--max-memory-gb", type=float, default=None,
+                        help="Memory budget for all workers. Defaults to the currently available memory.")
+    parser.add_argument("--force", action="store_true",
+                        help="Rebuild every output, even if its inputs have not changed since the last run.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="List the outputs that would be rebuilt without extracting anything.")
+    parser.add_argument("--outputs", default=None,
+                        help="Comma separated outputs to extract, e.g. trade_gw,dispatch. Names may be shortened "
+                             "to a unique prefix (dispatch is dispatch_by_segment_gwh). Only the GDX symbols and steps those outputs need are loaded. "
+                             f"Defaults to every output: {', '.join(pipeline.outputs())}.")
+    parser.add_argument("--format", choices=list(OUTPUT_FORMATS), default="csv",
+                        help="Output file format. Parquet and Feather files use categorical tech, region and segment "
+                             "columns, int16 years and hours, and float32 values where precision allows. Defaults to csv.")
+    parser.add_argument("--partition-by-year", action="store_true",
+                        help="Write each Parquet output as a folder with one file per year.")
+    parser.add_argument("--compression", choices=["none"] + list(COMPRESSION), default="none",
+                        help="Compress outputs. Csv files are written as .csv.gz or .csv.zst (zstd needs the zstandard "
+                             "package); Parquet and Feather files set their internal codec (Feather only supports "
+                             "zstd). Defaults to none.")
+    parser.add_argument("--writers", type=int, default=2,
+                        help="Threads writing finished outputs in the background while the next outputs are computed. "
+                             "0 writes each output before moving on. Defaults to 2.")
+    parser.add_argument("--max-pending-write-mb", type=float, default=1024,
+                        help="Pause computing while the outputs waiting to be written use more than this much memory. "
+                             "Defaults to 1024.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Build and write ca_hourly_mapping one tech at a time, aggregating the hourly availability "
+                             "factors one year at a time, to bound peak memory on large runs.")
+    parser.add_argument("--max-rss-gb", type=float, default=None,
+                        help="Fail a scenario if its process uses more than this much memory while building "
+                             "ca_hourly_mapping. Also used as the memory per worker when choosing the number of workers.")
+    parser.add_argument("--segment-outputs", action="store_true",
+                        help=f"Write {' and '.join(SEGMENT_OUTPUTS)} at segment level instead of copying each value onto "
+                             "every hour of its segment. The hour_segments output maps hours to segments; expand them "
+                             "with hours.HourIndex in Python or read_hourly in R.")
+    parser.add_argument("--no-store", action="store_true",
+                        help=f"Do not write the outputs to the consolidated store (cleaned_data/{STORE_FILE}).")
+    parser.add_argument("--reader", choices=READERS, default=None,
+                        help="GDX reader. numpy (gams.core.numpy, GAMS 43 or later) reads only the values and builds the "
+                             "domain columns from integer element indices; transfer uses gams.transfer. Defaults to numpy "
+                             "if available.")
+    parser.add_argument("--input-cache", default=None, metavar="FOLDER",
+                        help="Folder caching the scenario independent inputs (hour to segment mapping, endusescen loads "
+                             "and availability factors) between runs. Entries are rebuilt when their GDX files change. "
+                             "Defaults to cleaned_data/input_cache.")
+    parser.add_argument("--no-input-cache", action="store_true",
+                        help="Build the scenario independent inputs from GDX without using or updating the input cache.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Time every step, GDX read and output write, and report wall and CPU time, memory, rows "
+                             f"and bytes per stage in cleaned_data/{REPORT_FILE} and a summary table.")
+    parser.add_argument("--profile-dump", default=None, metavar="FOLDER",
+                        help="Also write cProfile stats and the largest allocations of each scenario's slowest stage to "
+                             "FOLDER. Slows the run down considerably.")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running, extracting scenarios (all, or those matching the scenario arguments) as "
+                             "their GDX files are written or updated. Stop with Ctrl+C.")
+    parser.add_argument("--watch-interval", type=float, default=30, metavar="SECONDS",
+                        help="With --watch, seconds between looks for new GDX files (default 30)")
+    parser.add_argument("--settle-seconds", type=float, default=60, metavar="SECONDS",
+                        help="With --watch, seconds a GDX file must stay unchanged before it is read, so files still "
+                             "being written are skipped (default 60)")
+    parser.add_argument("--deltas", default=None, metavar="BASELINE",
+                        help="After extracting, write the differences of every scenario from BASELINE (capacity, "
+                             "investment, generation, emissions, costs and dispatch) to cleaned_data/deltas/BASELINE. "
+                             "BASELINE is extracted too if it is not selected.")
+    parser.add_argument("--delta-metrics", default=None,
+                        help=f"With --deltas, comma separated metrics to compare. Defaults to every metric: "
+                             f"{', '.join(DELTA_METRICS)}.")
+    parser.add_argument("--delta-top", type=int, default=None, metavar="N",
+                        help="With --deltas, also write the N largest changes of each metric for each scenario")
+    args = parser.parse_args()
+    if args.deltas and (args.watch or args.no_store):
+        parser.error("--deltas reads the consolidated store, and cannot be combined with --watch or --no-store")
+    if (args.delta_metrics or args.delta_top) and not args.deltas:
+        parser.error("--delta-metrics and --delta-top require --deltas")
+    delta_metrics = [m.strip() for m in args.delta_metrics.split(",") if m.strip()] if args.delta_metrics else None
+    unknown = [m for m in delta_metrics or [] if m not in DELTA_METRICS]
+    if unknown:
+        parser.error(f"Unknown delta metrics {unknown}. Metrics are: {', '.join(DELTA_METRICS)}")
+    if args.watch and (args.dry_run or args.force or args.profile or args.profile_dump):
+        parser.error("--watch cannot be combined with --dry-run, --force, --profile or --profile-dump")
+    if args.partition_by_year and args.format != "parquet":
+        parser.error("--partition-by-year requires --format parquet")
+    compression = None if args.compression == "none" else args.compression
+    try:
+        check_compression(args.format, compression)
+        get_reader(args.reader)
+    except ValueError as e:
+        parser.error(str(e))
+    outputs = None
+    if args.outputs:
+        try:
+            outputs = pipeline.resolve([o.strip() for o in args.outputs.split(",") if o.strip()])
+        except ValueError as e:
+            parser.error(str(e))
+
+    options = dict(fmt=args.format, partition_by_year=args.partition_by_year, compression=compression,
+                   stream=args.stream, max_rss_gb=args.max_rss_gb, store=not args.no_store,
+                   segments=args.segment_outputs, writers=args.writers,
+                   max_pending_write_mb=args.max_pending_write_mb, reader=args.reader,
+                   input_cache_folder=None if args.no_input_cache else
+                   args.input_cache or os.path.join(output_root, "input_cache"))
+    if args.watch:
+        failures = watch(args.scenarios, args.workers or 2, outputs, args.watch_interval, args.settle_seconds, **options)
+        if failures:
+            print(f"{len(failures)} scenarios failed: {sorted(failures)}")
+            raise SystemExit(1)
+        return
+
+    scenarios = select_scenarios(args.scenarios)
+    if args.deltas and args.deltas not in scenarios:
+        scenarios.append(args.deltas)
+    print(f"Extracting {scenarios}")
+    failures = extract_batch(scenarios, args.workers, args.max_memory_gb, args.force, args.dry_run, outputs,
+                             profile=args.profile, profile_dump=args.profile_dump, **options)
+    if args.deltas and not args.dry_run and args.deltas not in failures:
+        write_deltas(args.deltas, [scen for scen in scenarios if scen not in failures], delta_metrics, args.delta_top,
+                     args.format, compression)
+    if failures:
+        print(f"{len(failures)} of {len(scenarios)} scenarios failed: {sorted(failures)}")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -25,11 +25,7 @@ if (!dir.exists(figures_folder)) {
 
 data_folder = file.path("..", "cleaned_data")
 
-investments = plyr::ldply(scenarios, function(scen) {
-    df = read_csv(file.path(data_folder, scen, "ca_investment.csv")) %>%
-            mutate(scenario = scen)
-    return(df)
-    }) %>%
+investments = read_scenarios(data_folder, "ca_investment", scenarios) %>%
   mutate(tech = if_else(tech %in% c("Storage-capacity"), "Storage", tech)) %>%
   filter(year != 2020) %>%
   mutate(tech = factor(tech, levels = TECH_ORDER)) %>%
@@ -53,12 +49,8 @@ ggplot(invest_2040, aes(x = scenario, y = investment, fill = tech)) +
 ggsave(file.path(figures_folder, "cumulative_investment_2040.png"), height = PLOT_HEIGHT, width = PLOT_WIDTH, units = "in", dpi = DPI)
 ###
 
-capacity = plyr::ldply(scenarios, function(scen) {
-    df = read_csv(file.path(data_folder, scen, "capacity_gw.csv")) %>%
-            filter(region == "CA") %>%
-            mutate(scenario = scen)
-    return(df)
-    })
+capacity = read_scenarios(data_folder, "capacity_gw", scenarios) %>%
+    filter(region == "CA")
 
 cap = capacity  %>%
     filter(!(tech %in% c("Peak Load"))) %>%
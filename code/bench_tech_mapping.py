@@ -0,0 +1,47 @@
+# Micro-benchmark of the tech class mapping in get_tech: the previous row by row split and map against map_unique,
+# which maps each unique tech class once. Run with `python bench_tech_mapping.py [rows]`.
+import sys
+import time
+import importlib
+import numpy as np
+import pandas as pd
+from mapping import map_unique
+
+extract = importlib.import_module("1_extract_data")
+
+
+def row_wise(tech_class: pd.Series) -> pd.Series:
+    # get_tech before map_unique
+    return tech_class.apply(lambda x: x.split("-")[0]).map(extract.TECH_SET)
+
+
+def unique_values(tech_class: pd.Series) -> pd.Series:
+    return map_unique(tech_class, lambda x: extract.TECH_SET.get(x.split("-")[0], np.nan))
+
+
+def best_time(func, values: pd.Series, repeat: int = 3) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(values)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    # Hourly frames have a few hundred tech classes (tech-resource class) repeated over hours, regions and years
+    classes = [f"{tech}-{n}" for tech in extract.TECH_SET for n in range(1, 11)]
+    tech_class = pd.Series(np.random.default_rng(0).choice(classes, rows))
+
+    print(f"Mapping {rows:,} rows of {len(classes)} tech classes")
+    pd.testing.assert_series_equal(row_wise(tech_class), unique_values(tech_class))
+    baseline = best_time(row_wise, tech_class)
+    print(f"{'row wise':<24}{baseline:8.3f} s")
+    for name, values in [("unique (object)", tech_class), ("unique (categorical)", tech_class.astype("category"))]:
+        seconds = best_time(unique_values, values)
+        print(f"{name:<24}{seconds:8.3f} s  ({baseline / seconds:,.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+# Reproducible benchmark of 1_extract_data.py on synthetic inputs with the same GDX symbols and dimensions as a REGEN
+# run, so extraction performance can be measured without a CA_REGEN_v0 tree. Every output step, GDX read and output
+# write is timed along with the whole run. Results are appended to a JSON history, and the benchmark fails if a stage
+# is slower than the recent history at the same scale.
+#
+#   python benchmark.py
+#   python benchmark.py --regions 17 --tech-classes 60 --years 7 --label "hourly mapping in chunks"
+#   python benchmark.py --gdx    # write real GDX files with gams.transfer and read them back
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import platform
+import statistics
+import subprocess
+import importlib
+import numpy as np
+import pandas as pd
+from manifest import atomic_write
+
+extract = importlib.import_module("1_extract_data")
+
+HISTORY_FILE = os.path.join("..", "benchmarks", "history.json")
+SCENARIO = "benchmark"
+# Number of earlier runs at the same scale and on the same machine that a run is compared with
+BASELINE_RUNS = 5
+# Stages that change by less than this many seconds are not flagged, as their timings are mostly noise
+MIN_REGRESSION_S = 0.05
+
+# Tech class prefixes (see TECH_SET) that synthetic tech classes cycle through
+TECH_PREFIXES = ["wind", "pvft", "pvsx", "wnos", "ngcc", "nggt", "nucl", "hydr", "geot", "bioe", "h2cc", "ngcr"]
+STORAGE = ["li-ion", "pump"]
+REPORT_TYPES = ["xnuc1", "nnuc2", "geot", "hydr", "bioe", "xngc1", "nngc2", "xngp", "xwnd1", "nwnd2", "xspv", "nspv",
+                "stor", "peakload"]
+DSPS_TYPES = ["h2prod_ht", "h2prod_ne", "h2prod_pa", "h2stortrn", "other"]
+VALUE_COLUMNS = ["value", "level", "marginal", "lower", "upper", "scale", "element_text"]
+
+
+def scale_sets(regions: int, tech_classes: int, vintages: int, years: int, hours: int, segments: int) -> dict:
+    """
+    Set elements of a synthetic run. Regions are the California regions first, then the rest of the WECC,
+    then made up regions.
+    """
+    region_names = list(extract.STATE_MAPPING)
+    region_names += [f"region_{i}" for i in range(len(region_names), regions)]
+    classes = [f"{TECH_PREFIXES[i % len(TECH_PREFIXES)]}-{i // len(TECH_PREFIXES) + 1}" for i in range(tech_classes)]
+    # Capital and FOM costs need a 2020 and a 2050+ vintage
+    vintage_names = [str(2020 + 5 * i) for i in range(max(vintages, 2) - 1)] + ["2050+"]
+    region_names = region_names[:regions]
+    return {
+        "regions": region_names,
+        "cal_r": [r for r in region_names if extract.STATE_MAPPING.get(r) == "ca"],
+        "classes": classes,
+        "re_classes": [c for c in classes if extract.TECH_SET.get(c.split("-")[0]) in extract.RE_TECH],
+        "vintages": vintage_names,
+        # Vintages that can have existing capacity
+        "built": vintage_names[:-1],
+        "years": [str(2020 + 5 * i) for i in range(years)],
+        "hours": [str(h) for h in range(1, hours + 1)],
+        "segments": [str(s) for s in range(1, segments + 1)],
+    }
+
+
+def records(rng, kind: str, **dims) -> pd.DataFrame:
+    """
+    Records of a GDX symbol over every combination of dims, with categorical domain columns like gams.transfer.
+
+    Parameters:
+    rng  (Generator) : Random values.
+    kind (str)       : "set", "parameter" or "variable".
+    dims             : Column name -> elements.
+    """
+    sizes = [len(values) for values in dims.values()]
+    n = int(np.prod(sizes))
+    columns = {}
+    inner = n
+    for (name, values), size in zip(dims.items(), sizes):
+        inner //= size
+        codes = np.tile(np.repeat(np.arange(size, dtype=np.int32), inner), n // (inner * size))
+        columns[name] = pd.Categorical.from_codes(codes, categories=values)
+    df = pd.DataFrame(columns)
+    if kind == "set":
+        df["element_text"] = ""
+    elif kind == "parameter":
+        df["value"] = rng.random(n)
+    else:
+        df["level"] = rng.random(n)
+        for col in ["marginal", "lower", "upper", "scale"]:
+            df[col] = 0.0
+    return df
+
+
+def hour_segments(rng, sets: dict, year: str) -> pd.DataFrame:
+    """
+    Records of hrep for a year: every hour mapped to a representative segment.
+    """
+    codes = np.sort(rng.integers(0, len(sets["segments"]), len(sets["hours"])))
+    return pd.DataFrame({"hour": pd.Categorical(sets["hours"]),
+                         "s": pd.Categorical.from_codes(codes, categories=sets["segments"]),
+                         "t": pd.Categorical([year] * len(sets["hours"])),
+                         "element_text": ""})
+
+
+def synthetic_inputs(sets: dict, seed: int = 0) -> dict:
+    """
+    Synthetic records of every symbol the extraction reads, by the GDX path it is read from (see source_paths).
+    Returns path -> {symbol: records}.
+    """
+    rng = np.random.default_rng(seed)
+    i, v, built, r, t = sets["classes"], sets["vintages"], sets["built"], sets["regions"], sets["years"]
+    h, s, re_classes = sets["hours"], sets["segments"], sets["re_classes"]
+    paths = extract.source_paths(SCENARIO)
+    inputs = {
+        paths["model"][0]: {
+            "cal_r": records(rng, "set", r=sets["cal_r"]),
+            "capcost": records(rng, "parameter", i=i, v=v, r=r),
+            "fomcost": records(rng, "parameter", i=i, v=v, r=r),
+            "icost": records(rng, "parameter", i=i, v=v, r=r, t=t),
+            "icg": records(rng, "parameter", j=STORAGE, t=t),
+            "irg": records(rng, "parameter", j=STORAGE, t=t),
+            "CO2_ELEC": records(rng, "variable", r=r, t=t),
+            "GC": records(rng, "variable", j=STORAGE, r=r, t=t),
+            "GR": records(rng, "variable", j=STORAGE, r=r, t=t),
+            "IGC": records(rng, "variable", j=STORAGE, r=r, t=t),
+            "IGR": records(rng, "variable", j=STORAGE, r=r, t=t),
+            "XC": records(rng, "variable", i=i, v=built, r=r, t=t),
+            "IX": records(rng, "variable", i=i, v=built, r=r, t=t),
+            "G": records(rng, "variable", s=s, j=STORAGE[:1], r=r, t=t),
+            "GD": records(rng, "variable", s=s, j=STORAGE[:1], r=r, t=t),
+            "X": records(rng, "variable", s=s, i=i, v=built, r=r, t=t),
+            "X_45V": records(rng, "variable", s=s, i=re_classes[:1], v=built[:1], r=r, t=t),
+            "E": records(rng, "variable", s_0=s, r_1=r, r_2=r, t_3=t),
+        },
+        paths["report"][0]: {
+            "dspsrpt_r": records(rng, "parameter", uni_0=["demand", "supply"], s_1=s, r_2=r, uni_3=DSPS_TYPES, t_4=t),
+        },
+        paths["reporting"][0]: {
+            "gencaprpt": records(rng, "parameter", uni_0=["CA", "WECC"] + sets["cal_r"], grc_1=REPORT_TYPES, t_2=t,
+                                 uni_3=["TWh", "gw"]),
+        },
+        paths["segdata_8760"][0]: {
+            "load_s": records(rng, "parameter", r=r, h=h, t=t),
+            "vrsc": records(rng, "parameter", uni=re_classes, v=built, r=r, h=h, t=t),
+        },
+        paths["segdata_100"][0]: {
+            "load_s": records(rng, "parameter", r=r, s=s, t=t),
+            "vrsc": records(rng, "parameter", uni=re_classes, v=built, r=r, s=s, t=t),
+        },
+    }
+    for year, path in zip(extract.year_list, paths["hrep"]):
+        inputs[path] = {"hrep": hour_segments(rng, sets, str(year))}
+    return inputs
+
+
+class SyntheticReader:
+    """
+    Stand-in for reading GDX files (see GdxCache) that serves synthetic records from memory.
+    Every read returns fresh copies, as a file read would.
+    """
+
+    def __init__(self, inputs: dict):
+        self.inputs = inputs
+
+    def __call__(self, gdx_path: str, symbols: list) -> dict:
+        found = self.inputs.get(gdx_path, {})
+        return {s: found[s].copy() for s in symbols if s in found}
+
+
+def write_gdx(path: str, symbols: dict):
+    """
+    Write synthetic records to a GDX file with gams.transfer. Domains are relaxed to the column names, with the
+    numbered suffixes gams.transfer adds to repeated domains removed.
+    """
+    import gams.transfer as gt
+    container = gt.Container()
+    for name, df in symbols.items():
+        domain = [re.sub(r"_\d+$", "", col).replace("uni", "*") for col in df.columns if col not in VALUE_COLUMNS]
+        if "element_text" in df.columns:
+            gt.Set(container, name, domain, records=df)
+        elif "level" in df.columns:
+            gt.Variable(container, name, domain=domain, records=df)
+        else:
+            gt.Parameter(container, name, domain, records=df)
+    container.write(path)
+
+
+def create_inputs(root: str, inputs: dict, gdx: bool):
+    """
+    Create the input files of a synthetic run under root. Without gdx the files are placeholders, as the records are
+    served by SyntheticReader, but they still need to exist for the manifest and the GDX cache.
+    """
+    for path, symbols in inputs.items():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if gdx:
+            write_gdx(path, symbols)
+        else:
+            with open(path, "w") as f:
+                f.write(f"synthetic {', '.join(symbols)}\n")
+
+
+def run_once(options: dict) -> tuple:
+    """
+    Extract every output of the synthetic scenario. Returns the end to end time and the seconds of each stage,
+    excluding nested stages, totalled by stage name.
+    """
+    shutil.rmtree(extract.output_root, ignore_errors=True)
+    start = time.perf_counter()
+    report = extract.extract_scenario(SCENARIO, force=True, profile=True, **options)
+    end_to_end = time.perf_counter() - start
+    stages = {}
+    for stage in report["stages"]:
+        stages[stage["stage"]] = stages.get(stage["stage"], 0.0) + stage["self_wall_s"]
+    return end_to_end, stages
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path: str) -> list:
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_history(history: list, path: str):
+    """
+    Write the history through a temporary file so an interrupted run cannot corrupt it.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    atomic_write(path, lambda f: json.dump(history, f, indent=2))
+
+
+def compare(entry: dict, history: list, threshold: float) -> tuple:
+    """
+    Compare a run with the median of the last BASELINE_RUNS runs with the same scale and host.
+
+    Returns:
+    list: (stage, seconds, baseline seconds or None) for the end to end run and every stage, slowest first.
+    list: Stages slower than the baseline by more than threshold (a fraction) and MIN_REGRESSION_S.
+    """
+    earlier = [e for e in history if e["scale"] == entry["scale"] and e["host"] == entry["host"]][-BASELINE_RUNS:]
+    timings = {"end to end": entry["end_to_end_s"], **entry["stages"]}
+    rows, regressions = [], []
+    for stage, seconds in sorted(timings.items(), key=lambda x: -x[1]):
+        previous = [e["end_to_end_s"] if stage == "end to end" else e["stages"].get(stage) for e in earlier]
+        previous = [p for p in previous if p is not None]
+        baseline = statistics.median(previous) if previous else None
+        rows.append((stage, seconds, baseline))
+        if baseline is not None and seconds > baseline * (1 + threshold) and seconds - baseline > MIN_REGRESSION_S:
+            regressions.append(stage)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark 1_extract_data.py on synthetic REGEN inputs.")
+    parser.add_argument("--regions", type=int, default=11, help="Number of regions. The first 7 are in California.")
+    parser.add_argument("--tech-classes", type=int, default=24, help="Number of generator tech classes.")
+    parser.add_argument("--vintages", type=int, default=4, help="Number of vintages, including 2050+.")
+    parser.add_argument("--years", type=int, default=3, help="Number of model years, from 2020 in steps of 5.")
+    parser.add_argument("--hours", type=int, default=8760, help="Number of hours in segdata_8760 and hrep.")
+    parser.add_argument("--segments", type=int, default=100, help="Number of representative segments.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic values.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs to time. The fastest time of each stage is kept.")
+    parser.add_argument("--gdx", action="store_true",
+                        help="Write the inputs as GDX files with gams.transfer and read them back, so GDX reads are "
+                             "timed too. By default the inputs are served from memory.")
+    parser.add_argument("--format", choices=list(extract.OUTPUT_FORMATS), default="csv", help="Output file format.")
+    parser.add_argument("--compression", choices=["none"] + list(extract.COMPRESSION), default="none",
+                        help="Output compression.")
+    parser.add_argument("--writers", type=int, default=2, help="Background output writer threads.")
+    parser.add_argument("--stream", action="store_true", help="Build and write ca_hourly_mapping one tech at a time.")
+    parser.add_argument("--no-store", action="store_true", help="Do not write the outputs to the consolidated store.")
+    parser.add_argument("--history", default=HISTORY_FILE, help=f"JSON history of benchmark runs. Defaults to {HISTORY_FILE}.")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Fail if a stage is this fraction slower than the median of recent runs. Defaults to 0.2.")
+    parser.add_argument("--label", default="", help="Note stored with the run, e.g. the change being measured.")
+    parser.add_argument("--no-save", action="store_true", help="Compare with the history without adding this run.")
+    args = parser.parse_args()
+
+    scale = {"regions": args.regions, "tech_classes": args.tech_classes, "vintages": args.vintages, "years": args.years,
+             "hours": args.hours, "segments": args.segments, "seed": args.seed, "gdx": args.gdx,
+             "format": args.format, "compression": args.compression, "writers": args.writers, "stream": args.stream,
+             "store": not args.no_store}
+    folder = tempfile.mkdtemp(prefix="regen_benchmark_")
+    try:
+        extract.main_folder = os.path.join(folder, "CA_REGEN_v0")
+        extract.output_root = os.path.join(folder, "cleaned_data")
+        extract.year_list = [2020 + 5 * i for i in range(args.years)]
+        sets = scale_sets(args.regions, args.tech_classes, args.vintages, args.years, args.hours, args.segments)
+        inputs = synthetic_inputs(sets, args.seed)
+        input_rows = sum(len(df) for symbols in inputs.values() for df in symbols.values())
+        create_inputs(folder, inputs, args.gdx)
+        if args.gdx:
+            del inputs
+        else:
+            extract.gdx_reader = SyntheticReader(inputs)
+        print(f"Synthetic inputs: {input_rows:,} rows, {len(sets['regions'])} regions, {len(sets['classes'])} tech "
+              f"classes, {len(sets['vintages'])} vintages, {len(sets['years'])} years")
+
+        options = {"fmt": args.format, "compression": None if args.compression == "none" else args.compression,
+                   "writers": args.writers, "stream": args.stream, "store": not args.no_store}
+        runs = [run_once(options) for _ in range(max(args.repeat, 1))]
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    stages = {}
+    for _, run in runs:
+        for stage, seconds in run.items():
+            stages[stage] = min(stages.get(stage, seconds), seconds)
+    entry = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "label": args.label, "commit": git_commit(),
+             "host": platform.node(), "python": platform.python_version(), "pandas": pd.__version__,
+             "numpy": np.__version__, "scale": scale, "input_rows": input_rows,
+             "end_to_end_s": min(seconds for seconds, _ in runs), "stages": stages}
+
+    history = load_history(args.history)
+    rows, regressions = compare(entry, history, args.threshold)
+    print(f"{'stage':<36}{'seconds':>10}{'baseline':>10}{'change':>9}")
+    for stage, seconds, baseline in rows:
+        compared = f"{baseline:>10.3f}{seconds / baseline - 1:>+9.0%}" if baseline else f"{'':>19}"
+        flag = "  REGRESSION" if stage in regressions else ""
+        print(f"{stage[:35]:<36}{seconds:>10.3f}{compared}{flag}")
+    if not args.no_save:
+        save_history(history + [entry], args.history)
+        print(f"Saved to {args.history}")
+    if regressions:
+        print(f"{len(regressions)} stages are more than {args.threshold:.0%} slower than the last {BASELINE_RUNS} runs: "
+              f"{', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
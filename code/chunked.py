@@ -0,0 +1,39 @@
+# Helpers for building large outputs in chunks: aggregating one chunk at a time and joining on unique keys.
+import pandas as pd
+
+
+def chunked_groupby(chunks, keys: list, agg: dict) -> pd.DataFrame:
+    """
+    Same result as pd.concat(chunks).groupby(keys, observed=True).agg(agg).reset_index(), without holding every chunk in
+    memory at once. Only combinations of key values that occur are returned. Every group must be entirely within one
+    chunk (e.g. chunks are years and year is a key), and agg must be sum or mean.
+
+    Parameters:
+    chunks (iterable) : DataFrames with the same columns and dtypes.
+    keys   (list)     : Columns to group by.
+    agg    (dict)     : column -> "sum" or "mean".
+    """
+    parts = [chunk.groupby(keys, observed=True).agg(agg) for chunk in chunks]
+    return pd.concat(parts).sort_index().reset_index()
+
+
+def unique_keys(df: pd.DataFrame, keys: list, name: str) -> pd.DataFrame:
+    """
+    Drop duplicate rows of df and index it by keys, for joining with join_unique.
+    Raises ValueError if keys do not identify a single row.
+    """
+    indexed = df.drop_duplicates().set_index(keys)
+    if not indexed.index.is_unique:
+        raise ValueError(f"{name} has several rows for the same {', '.join(keys)}")
+    return indexed
+
+
+def join_unique(left: pd.DataFrame, right: pd.DataFrame, keys: list) -> pd.DataFrame:
+    """
+    Inner join of left with right, a frame indexed by unique keys (see unique_keys). Gives the same rows and columns as
+    left.merge(right.reset_index(), on=keys), in the order of left, but rows are looked up in the index of right,
+    which is only built once however many chunks are joined to it.
+    """
+    positions = right.index.get_indexer(pd.MultiIndex.from_frame(left[keys]))
+    found = positions >= 0
+    return pd.concat([left[found].reset_index(drop=True), right.iloc[positions[found]].reset_index(drop=True)], axis=1)
@@ -48,3 +48,54 @@ TECH_SUB = c("100% Hydrogen combined cycle" = "Hydrogen", "100% Hydrogen gas tur
                "Pumped_Hydro-capacity" = "DROP", "Pumped_Hydro-energy" = "DROP", "Rooftop Solar PV" = "Solar",
                "Utility Double Axis PV" = "Solar", "Utility Fixed Tilt PV" = "Solar", "Utility Single Axis PV" = "Solar",
                "Wind" = "Wind")
+
+# Read an output written by 1_extract_data.py in any of its formats (csv, compressed csv, parquet, feather, or parquet
+# partitioned by year).
+# If an output was written in several formats, the most recently written file is used.
+read_output = function(folder, name) {
+  files = file.path(folder, c(paste0(name, c(".csv", ".csv.gz", ".csv.zst", ".parquet", ".feather")), name))
+  files = files[file.exists(files)]
+  if (length(files) == 0) stop(paste("No output", name, "in", folder))
+  file = files[which.max(file.mtime(files))]
+  df = if (dir.exists(file)) {
+    arrow::open_dataset(file) %>% collect()
+  } else if (endsWith(file, ".parquet")) {
+    arrow::read_parquet(file)
+  } else if (endsWith(file, ".feather")) {
+    arrow::read_feather(file)
+  } else {
+    read_csv(file)
+  }
+  # Parquet and feather outputs store strings as dictionaries, read as factors
+  df %>% mutate(across(where(is.factor), as.character))
+}
+
+# Read an output at hourly resolution. Outputs written at segment level (1_extract_data.py --segment-outputs) have no
+# hour column; each row is copied onto every hour of its segment using the hour_segments output.
+read_hourly = function(folder, name) {
+  df = read_output(folder, name)
+  if ("hour" %in% names(df)) return(df)
+  hour_segments = read_output(folder, "hour_segments")
+  df %>% inner_join(hour_segments, by = c("year", "segment"), relationship = "many-to-many")
+}
+
+# Read an output for several scenarios, with a scenario column. Uses the consolidated store written by 1_extract_data.py
+# (cleaned_data/outputs.sqlite) when it has every scenario, and otherwise reads each scenario's output with read_output.
+read_scenarios = function(data_folder, name, scenarios) {
+  store = file.path(data_folder, "outputs.sqlite")
+  if (file.exists(store)) {
+    con = DBI::dbConnect(RSQLite::SQLite(), store)
+    on.exit(DBI::dbDisconnect(con))
+    placeholders = paste(rep("?", length(scenarios)), collapse = ", ")
+    stored = DBI::dbGetQuery(con, paste0("SELECT scenario FROM _outputs WHERE output = ? AND scenario IN (", placeholders, ")"),
+                             params = c(list(name), as.list(scenarios)))
+    if (all(scenarios %in% stored$scenario)) {
+      df = DBI::dbGetQuery(con, paste0('SELECT * FROM "', name, '" WHERE scenario IN (', placeholders, ")"),
+                           params = as.list(scenarios))
+      return(as_tibble(df))
+    }
+  }
+  plyr::ldply(scenarios, function(scen) {
+    read_output(file.path(data_folder, scen), name) %>% mutate(scenario = scen)
+  }) %>% as_tibble()
+}
@@ -0,0 +1,138 @@
+# Dependency graph of extraction steps. Each step declares the GDX symbols it reads and the steps it depends on,
+# so a run only loads and computes what the requested outputs need.
+import inspect
+
+
+class Node:
+    """
+    A step in the extraction. Its dependencies are the names of the function's parameters, and it is called
+    with the values computed by those steps. Dependencies in optional are left out of runs without optional
+    dependencies (see Graph.run), which pass None for them instead.
+    """
+
+    def __init__(self, func, symbols: dict, output: bool, optional: list = None):
+        self.name = func.__name__
+        self.func = func
+        self.symbols = symbols or {}
+        self.deps = list(inspect.signature(func).parameters)
+        self.output = output
+        self.optional = list(optional or [])
+
+    def needs(self, optional: bool = True) -> list:
+        """
+        Dependencies computed for this step, leaving out the optional ones unless optional is True.
+        """
+        return self.deps if optional else [dep for dep in self.deps if dep not in self.optional]
+
+
+class Graph:
+    """
+    Registry of extraction steps. Intermediates are registered with node and outputs with output:
+
+        @graph.node(symbols={"model": ["cal_r"]})
+        def cal_r():
+            ...
+
+        @graph.output(symbols={"model": ["E"]})
+        def trade_gw(rep_hours):
+            ...
+    """
+
+    def __init__(self):
+        self.nodes = {}
+
+    def node(self, symbols: dict = None, output: bool = False, optional: list = None):
+        """
+        Register a step. symbols is a dictionary of source -> list of GDX symbols the step reads, and optional the
+        dependencies it can do without (see Node).
+        """
+        def register(func):
+            self.nodes[func.__name__] = Node(func, symbols, output, optional)
+            return func
+        return register
+
+    def output(self, symbols: dict = None, optional: list = None):
+        """
+        Register a step whose result is written as an output.
+        """
+        return self.node(symbols, output=True, optional=optional)
+
+    def outputs(self) -> list:
+        return [name for name, node in self.nodes.items() if node.output]
+
+    def resolve(self, selection: list) -> list:
+        """
+        Match requested output names to registered outputs. A name may be shortened to any unique prefix
+        (e.g. dispatch for dispatch_by_segment_gwh). Raises ValueError for unknown or ambiguous names.
+        """
+        outputs = self.outputs()
+        resolved = []
+        for requested in selection:
+            matches = [requested] if requested in outputs else [o for o in outputs if o.startswith(requested)]
+            if len(matches) != 1:
+                problem = "matches several outputs" if matches else "is not an output"
+                raise ValueError(f"{requested} {problem}. Outputs are: {', '.join(outputs)}")
+            resolved.append(matches[0])
+        return resolved
+
+    def subgraph(self, targets, optional: bool = True) -> list:
+        """
+        Names of every step needed to compute targets, ordered so each step comes after its dependencies. Optional
+        dependencies are only included if optional is True.
+        """
+        order = []
+        visiting = set()
+
+        def visit(name):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through {name}")
+            visiting.add(name)
+            for dep in self.nodes[name].needs(optional):
+                visit(dep)
+            visiting.discard(name)
+            order.append(name)
+
+        for name in targets:
+            visit(name)
+        return order
+
+    def sources(self, name: str, optional: bool = True) -> dict:
+        """
+        Every GDX symbol needed to compute name, including those read by its dependencies (with the optional ones if
+        optional is True), as source -> sorted symbols.
+        """
+        symbols = {}
+        for step in self.subgraph([name], optional):
+            for source, names in self.nodes[step].symbols.items():
+                symbols.setdefault(source, set()).update(names)
+        return {source: sorted(names) for source, names in symbols.items()}
+
+    def run(self, targets, on_output, call=None, optional: bool = True):
+        """
+        Compute the minimal subgraph for targets. on_output(name, value) is called for each target as soon as it is
+        computed. Each result is dropped once no later step needs it, so intermediates do not outlive their consumers.
+        If given, call(name, func, kwargs) runs each step instead of func(**kwargs), e.g. to profile it. Without
+        optional, optional dependencies are not computed and steps get None for them.
+        """
+        order = self.subgraph(targets, optional)
+        last_use = {}
+        for i, name in enumerate(order):
+            for dep in self.nodes[name].needs(optional):
+                last_use[dep] = i
+
+        values = {}
+        for i, name in enumerate(order):
+            node = self.nodes[name]
+            needs = node.needs(optional)
+            kwargs = {dep: values[dep] if dep in needs else None for dep in node.deps}
+            values[name] = call(name, node.func, kwargs) if call else node.func(**kwargs)
+            del kwargs
+            if name in targets:
+                on_output(name, values[name])
+            for dep in needs:
+                if last_use[dep] == i:
+                    del values[dep]
+            if name not in last_use:
+                del values[name]
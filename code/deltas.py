@@ -0,0 +1,140 @@
+# Differences of outputs between scenarios and a baseline scenario, for comparing sweeps of many scenarios. Each
+# metric is read from the consolidated store (see store.py) in one query for the baseline and every scenario, so each
+# scenario's rows are loaded once however many scenarios are compared. The rows are aligned on the metric's keys as a
+# scenarios x keys array, and every scenario is compared with the baseline at once:
+#
+#   store = OutputStore("../cleaned_data/outputs.sqlite")
+#   tables = scenario_deltas(store, "reference", ["base", "min_compliance"], top=10)
+#   tables["capacity"], tables["capacity_top10"]
+import numpy as np
+import pandas as pd
+
+# metric -> (output, key columns, value column). Outputs pivoted to one column per year have no value column and are
+# unpivoted to a year column first.
+DELTA_METRICS = {
+    "capacity": ("ca_capacity", ["tech", "year"], "capacity"),
+    "investment": ("ca_investment", ["tech", "year"], "investment"),
+    "generation": ("generation_twh", ["tech", "region", "year"], "value"),
+    "emissions": ("regional_emissions_mtco2", ["region", "year"], None),
+    "capital_costs": ("capcosts_usd2024", ["tech", "year"], None),
+    "fom_costs": ("fom_costs_usd2024", ["tech", "year"], None),
+    "marginal_costs": ("marginal_costs_usd2024", ["tech", "vintage"], "marginal_cost"),
+    "dispatch": ("dispatch_by_segment_gwh", ["tech", "year", "segment"], "level"),
+}
+
+
+def metric_records(df: pd.DataFrame, keys: list, value: str = None) -> pd.DataFrame:
+    """
+    Rows of an output read from the store as scenario, keys and a value column. Pivoted outputs (value None) are
+    unpivoted, with their column names as years. Rows copied onto every hour (see --segment-outputs) are kept once.
+    """
+    if value is None:
+        ids = ["scenario"] + [key for key in keys if key != "year"]
+        df = df.melt(id_vars=ids, var_name="year", value_name="value").dropna(subset=["value"])
+        value = "value"
+    df = df[["scenario"] + keys + [value]].drop_duplicates()
+    return df.rename(columns={value: "value"})
+
+
+def align(df: pd.DataFrame, keys: list, scenarios: list):
+    """
+    Values of every scenario as a scenarios x keys array, summing rows with the same keys.
+
+    Parameters:
+    df        (DataFrame) : Rows from metric_records.
+    keys      (list)      : Key columns.
+    scenarios (list)      : Scenarios, in the order of the array rows. Rows of other scenarios are left out.
+    Returns:
+    DataFrame: The keys of each array column, in sorted order.
+    ndarray: scenarios x keys values, 0 where a scenario has no row.
+    ndarray: scenarios x keys, whether each scenario has a row.
+    """
+    rows = pd.Index(scenarios).get_indexer(df["scenario"])
+    df = df[rows >= 0]
+    rows = rows[rows >= 0]
+    codes, uniques = pd.MultiIndex.from_frame(df[keys]).factorize(sort=True)
+    shape = (len(scenarios), len(uniques))
+    values = np.zeros(shape)
+    present = np.zeros(shape, dtype=bool)
+    np.add.at(values, (rows, codes), df["value"].to_numpy(dtype=np.float64))
+    present[rows, codes] = True
+    return uniques.set_names(keys).to_frame(index=False), values, present
+
+
+def deltas(df: pd.DataFrame, keys: list, baseline: str, scenarios: list, top: int = None) -> dict:
+    """
+    Difference of every scenario from baseline for one metric.
+
+    Parameters:
+    df        (DataFrame)     : Rows from metric_records, including the baseline's.
+    keys      (list)          : Key columns.
+    baseline  (str)           : Scenario the others are compared with.
+    scenarios (list)          : Scenarios compared with baseline.
+    top       (int, optional) : Also return the top largest changes (by absolute delta) of each scenario.
+    Returns:
+    dict: "deltas" -> scenario, keys, baseline, value and delta of every key either scenario has, and "top" -> the
+          largest changes if top is given. Missing values count as 0.
+    """
+    index, values, present = align(df, keys, [baseline] + scenarios)
+    delta = values[1:] - values[0]
+    # Keys the scenario or the baseline has
+    keep = present[1:] | present[0]
+    rows, cols = np.nonzero(keep)
+    result = {"deltas": _table(index, scenarios, values[0], values[1:], delta, rows, cols)}
+    if top:
+        # Rank keys neither scenario has below every other key, so they are never among the largest changes
+        size = np.where(keep, np.abs(delta), -1.0)
+        order = np.argsort(-size, axis=1, kind="stable")[:, :top]
+        rows = np.repeat(np.arange(len(scenarios)), order.shape[1])
+        cols = order.ravel()
+        largest = keep[rows, cols]
+        result["top"] = _table(index, scenarios, values[0], values[1:], delta, rows[largest], cols[largest])
+    return result
+
+
+def _table(index: pd.DataFrame, scenarios: list, base: np.ndarray, values: np.ndarray, delta: np.ndarray,
+           rows: np.ndarray, cols: np.ndarray) -> pd.DataFrame:
+    """
+    Long table of the (scenario, key) cells at rows and cols of the scenarios x keys arrays.
+    """
+    return pd.concat([pd.DataFrame({"scenario": np.asarray(scenarios, dtype=object)[rows]}),
+                      index.iloc[cols].reset_index(drop=True),
+                      pd.DataFrame({"baseline": base[cols], "value": values[rows, cols], "delta": delta[rows, cols]})],
+                     axis=1)
+
+
+def scenario_deltas(store, baseline: str, scenarios: list, metrics: list = None, top: int = None) -> dict:
+    """
+    Deltas of every metric for scenarios against baseline, from the outputs in the store.
+
+    Parameters:
+    store     (OutputStore)    : Store holding the outputs of baseline and scenarios.
+    baseline  (str)            : Scenario the others are compared with.
+    scenarios (list)           : Scenarios compared with baseline. The baseline itself is left out.
+    metrics   (list, optional) : Metrics of DELTA_METRICS to compare. Defaults to every metric.
+    top       (int, optional)  : Also give the top largest changes of each metric for each scenario, as <metric>_top<N>.
+    Returns:
+    dict: table name (metric, or <metric>_top<N>) -> DataFrame. Metrics the baseline has no output for are left out.
+    """
+    scenarios = [scen for scen in scenarios if scen != baseline]
+    tables = {}
+    for metric in metrics or DELTA_METRICS:
+        output, keys, value = DELTA_METRICS[metric]
+        stored = store.scenarios(output)
+        if baseline not in stored:
+            print(f"No {output} for baseline {baseline}, skipping {metric} deltas")
+            continue
+        missing = [scen for scen in scenarios if scen not in stored]
+        if missing:
+            print(f"No {output} for {missing}, left out of {metric} deltas")
+        compared = [scen for scen in scenarios if scen in stored]
+        # One query reads the baseline and every scenario. Only the key and value columns are read, once per distinct
+        # row, so outputs expanded to hours (see --segment-outputs) come back at segment level.
+        columns = ["scenario"] + keys + [value] if value else None
+        rows = store.query(output, scenarios=[baseline] + compared, columns=columns, distinct=value is not None)
+        records = metric_records(rows, keys, value)
+        result = deltas(records, keys, baseline, compared, top)
+        tables[metric] = result["deltas"]
+        if top:
+            tables[f"{metric}_top{top}"] = result["top"]
+    return tables
@@ -0,0 +1,142 @@
+# Shared cache for GDX reads. Each GDX file is read once per run, loading only the symbols that were registered for it.
+import os
+import time
+import threading
+from collections import Counter
+from gdx_reader import read_transfer
+
+
+class GdxCache:
+    """
+    Reads each GDX file at most once, loading every symbol registered with require in a single pass.
+    Records are handed to consumers with get and are dropped once the last registered consumer has them,
+    so a file's data only stays in memory while something still needs it.
+
+    Records that are the same for many scenarios can be passed in as shared, a dictionary of (path, symbol) -> records.
+    Those are never read or evicted, and every consumer gets a copy.
+
+    File reads are recorded as stages of profiler (see profiling.py) if one is given.
+
+    Different files can be read from several threads at once, but each file only from one thread.
+
+    Files are read with reader, a function of (gdx_path, symbols) returning symbol -> records for the symbols found in
+    the file (see gdx_reader.py). Defaults to read_transfer.
+    """
+
+    def __init__(self, shared: dict = None, profiler=None, reader=None):
+        self.shared = shared or {}
+        self.profiler = profiler
+        self.reader = reader or read_transfer
+        # path -> number of consumers still waiting on each symbol
+        self._pending = {}
+        # path -> {symbol: records} read from the file and not yet handed out
+        self._records = {}
+        self.requests = 0
+        self.reads = 0
+        self.bytes_requested = 0
+        self.bytes_read = 0
+        self._lock = threading.Lock()
+
+    def require(self, gdx_path: str, symbols: list, consumers: int = 1):
+        """
+        Register symbols that will be loaded from gdx_path. Must be called before the first get for that file
+        so that all of its symbols are read in one pass.
+
+        Parameters:
+        gdx_path  (str)          : The path to the GDX file.
+        symbols   (list)         : Symbols that will be loaded from the file.
+        consumers (int, optional): Number of get calls expected for each symbol. Defaults to 1.
+        """
+        pending = self._pending.setdefault(gdx_path, Counter())
+        for symbol in symbols:
+            if (gdx_path, symbol) not in self.shared:
+                pending[symbol] += consumers
+
+    def get(self, gdx_path: str, symbol: str):
+        """
+        Return the records for symbol in gdx_path, reading the file if it has not been read yet.
+        Raises KeyError if the symbol is not in the GDX file.
+        """
+        file_size = os.path.getsize(gdx_path)
+        with self._lock:
+            self.requests += 1
+            self.bytes_requested += file_size
+        if (gdx_path, symbol) in self.shared:
+            return self.shared[(gdx_path, symbol)].copy()
+
+        loaded = self._records.setdefault(gdx_path, {})
+        if symbol not in loaded:
+            self._read(gdx_path, symbol, file_size)
+
+        pending = self._pending.setdefault(gdx_path, Counter())
+        pending[symbol] -= 1
+        if pending[symbol] > 0:
+            # Other consumers still need these records, so hand out a copy they can modify freely
+            return loaded[symbol].copy()
+
+        # Last consumer takes ownership of the records
+        del pending[symbol]
+        records = loaded.pop(symbol)
+        if not loaded and not pending:
+            self.evict(gdx_path)
+        return records
+
+    def release(self, gdx_path: str, symbol: str):
+        """
+        Tell the cache that a consumer registered with require will not get symbol after all (e.g. it was served from
+        the input cache), so the records are not read or kept for it.
+        """
+        pending = self._pending.get(gdx_path)
+        if not pending or pending[symbol] <= 0:
+            return
+        pending[symbol] -= 1
+        if pending[symbol] == 0:
+            del pending[symbol]
+            loaded = self._records.get(gdx_path, {})
+            loaded.pop(symbol, None)
+            if not loaded and not pending:
+                self.evict(gdx_path)
+
+    def evict(self, gdx_path: str):
+        """
+        Drop everything held for gdx_path.
+        """
+        self._records.pop(gdx_path, None)
+        self._pending.pop(gdx_path, None)
+
+    def _read(self, gdx_path: str, symbol: str, file_size: int):
+        """
+        Read symbol together with every other registered symbol from gdx_path that has not been read yet.
+        """
+        loaded = self._records[gdx_path]
+        pending = self._pending.get(gdx_path, Counter())
+        symbols = sorted({symbol} | {s for s, n in pending.items() if n > 0 and s not in loaded})
+
+        start = time.perf_counter()
+        if self.profiler is not None:
+            with self.profiler.stage(f"read {os.path.basename(gdx_path)}", "gdx") as record:
+                records = self.reader(gdx_path, symbols)
+                record["bytes_read"] = file_size
+        else:
+            records = self.reader(gdx_path, symbols)
+        read_s = time.perf_counter() - start
+        with self._lock:
+            self.reads += 1
+            self.bytes_read += file_size
+
+        for s in symbols:
+            if s in records:
+                loaded[s] = records[s]
+                if self.profiler is not None:
+                    self.profiler.symbol(gdx_path, s, loaded[s], read_s)
+        if symbol not in loaded:
+            raise KeyError(symbol)
+
+    def summary(self) -> str:
+        """
+        Report how many file reads and bytes the cache saved compared to reading the full file for every symbol.
+        """
+        saved_reads = self.requests - self.reads
+        saved_mb = (self.bytes_requested - self.bytes_read) / 1e6
+        return (f"GDX cache: {self.requests} symbol loads served by {self.reads} file reads "
+                f"({saved_reads} reads and {saved_mb:,.1f} MB saved)")
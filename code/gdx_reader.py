@@ -0,0 +1,214 @@
+# GDX reader backends. A reader is a function of (gdx_path, symbols) returning symbol -> records for the symbols found in
+# the file (see GdxCache).
+#
+#   transfer : gams.transfer, which builds every attribute column (level, marginal, lower, upper, scale, element text).
+#   numpy    : gams.core.numpy, which reads each symbol as integer element indices and a value array. Only the value
+#              (parameters) or level (variables and equations) is kept, and the domain columns are built as categoricals
+#              straight from the indices against one table of element labels shared by every file read.
+#
+# Check that both give the same records with `python gdx_reader.py <gdx file> [symbols]`, or on a generated file with
+# `python -m pytest test_gdx_reader.py`.
+import sys
+import threading
+import numpy as np
+import pandas as pd
+import gams.transfer as gt
+
+try:
+    import gams.core.gdx as gdxcc
+    from gams.core.numpy import Gams2Numpy
+except ImportError:
+    Gams2Numpy = None
+
+READERS = ["numpy", "transfer"]
+# Columns dropped from every symbol by load_gdx_symbol, which the numpy reader never builds
+UNUSED_COLUMNS = ["marginal", "lower", "upper", "scale", "element_text"]
+
+
+def read_transfer(gdx_path: str, symbols: list) -> dict:
+    """
+    Read symbols from gdx_path with gams.transfer. Returns symbol -> records, leaving out symbols missing from the file.
+    """
+    container = gt.Container()
+    try:
+        container.read(gdx_path, symbols=symbols)
+    except Exception:
+        # One of the registered symbols is missing from the file. Read them one at a time so that only
+        # the missing symbols fail.
+        container = gt.Container()
+        for s in symbols:
+            try:
+                container.read(gdx_path, symbols=[s])
+            except Exception:
+                pass
+    return {s: container.data[s].records for s in symbols if s in container.data}
+
+
+class UelTable:
+    """
+    Labels of every unique element (UEL) read so far, shared by all files, with a global id for each. Columns that use
+    the same elements share one categories index, so their categorical dtypes are equal and pandas joins them on the
+    integer codes.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.labels = []
+        self._categories = {}
+        # Files can be read from several threads at once
+        self._lock = threading.Lock()
+
+    def file_ids(self, uels: list) -> np.ndarray:
+        """
+        Global id of each of a file's elements, in the file's element order.
+        """
+        ids = np.empty(len(uels), dtype=np.int64)
+        with self._lock:
+            for i, label in enumerate(uels):
+                if label not in self.ids:
+                    self.ids[label] = len(self.labels)
+                    self.labels.append(label)
+                ids[i] = self.ids[label]
+        return ids
+
+    def categories(self, ids: np.ndarray) -> pd.Index:
+        """
+        Categories index of the elements with global ids, in that order.
+        """
+        key = ids.tobytes()
+        with self._lock:
+            if key not in self._categories:
+                self._categories[key] = pd.Index([self.labels[i] for i in ids], dtype=object)
+            return self._categories[key]
+
+
+uel_table = UelTable()
+_gams2numpy = None
+_system_directory = None
+_setup_lock = threading.Lock()
+
+
+def domain_labels(domain: list) -> list:
+    """
+    Column names of a symbol's domain, named the way gams.transfer names them: * is uni, and if a name repeats,
+    every column is numbered by its position.
+    """
+    labels = ["uni" if d == "*" else d for d in domain]
+    if len(set(labels)) < len(labels):
+        labels = [f"{label}_{i}" for i, label in enumerate(labels)]
+    return labels
+
+
+def read_numpy(gdx_path: str, symbols: list) -> dict:
+    """
+    Read symbols from gdx_path with gams.core.numpy. Returns symbol -> records with a categorical column for each
+    domain and a value or level column, leaving out symbols missing from the file. Falls back to read_transfer if the
+    file cannot be read this way.
+    """
+    global _gams2numpy, _system_directory
+    if Gams2Numpy is None:
+        return read_transfer(gdx_path, symbols)
+    handle = None
+    try:
+        # Inside the try, so a GAMS system directory that cannot be found also falls back to gams.transfer
+        with _setup_lock:
+            if _gams2numpy is None:
+                _system_directory = gt.Container().system_directory
+                _gams2numpy = Gams2Numpy(_system_directory)
+        handle = gdxcc.new_gdxHandle_tp()
+        rc, message = gdxcc.gdxCreateD(handle, _system_directory, gdxcc.GMS_SSSIZE)
+        if not rc:
+            raise RuntimeError(message)
+        rc, error = gdxcc.gdxOpenRead(handle, gdx_path)
+        if not rc:
+            raise RuntimeError(f"Could not open {gdx_path} (error {error})")
+        uels = _gams2numpy.gdxGetUelList(handle)
+        # Element indices start at 1; some versions include the unused index 0 in the list
+        if len(uels) == gdxcc.gdxUMUelInfo(handle)[1]:
+            uels = [None] + list(uels)
+        file_ids = uel_table.file_ids(uels)
+
+        records = {}
+        for symbol in symbols:
+            found, number = gdxcc.gdxFindSymbol(handle, symbol)
+            if not found:
+                continue
+            _, _, dim, kind = gdxcc.gdxSymbolInfo(handle, number)
+            if kind == gdxcc.GMS_DT_ALIAS:
+                raise ValueError(f"{symbol} is an alias")
+            domain = gdxcc.gdxSymbolGetDomainX(handle, number)[1]
+            keys, values = _gams2numpy.gdxReadSymbolRaw(handle, symbol)
+            columns = {}
+            for d, label in enumerate(domain_labels(domain)):
+                # Categories are the elements used in the column, in the file's element order, as with gams.transfer
+                used, codes = np.unique(keys[:, d], return_inverse=True)
+                columns[label] = pd.Categorical.from_codes(codes.astype(np.int32),
+                                                           dtype=pd.CategoricalDtype(uel_table.categories(file_ids[used])))
+            if kind == gdxcc.GMS_DT_PAR:
+                columns["value"] = values[:, 0]
+            elif kind != gdxcc.GMS_DT_SET:
+                columns["level"] = values[:, 0]
+            records[symbol] = pd.DataFrame(columns)
+        return records
+    except Exception as e:
+        print(f"Reading {gdx_path} with gams.core.numpy failed ({e}). Reading it with gams.transfer instead.")
+        return read_transfer(gdx_path, symbols)
+    finally:
+        if handle is not None:
+            gdxcc.gdxClose(handle)
+            gdxcc.gdxFree(handle)
+
+
+def get_reader(name: str = None):
+    """
+    Reader function of a backend in READERS. Defaults to numpy if gams.core.numpy is available, otherwise transfer.
+    """
+    if name is None:
+        name = "numpy" if Gams2Numpy is not None else "transfer"
+    if name not in READERS:
+        raise ValueError(f"Unknown GDX reader {name}. Readers are: {', '.join(READERS)}")
+    if name == "numpy" and Gams2Numpy is None:
+        raise ValueError("The numpy GDX reader needs gams.core.numpy, which comes with GAMS 43 or later")
+    return read_numpy if name == "numpy" else read_transfer
+
+
+def _difference(df: pd.DataFrame, expected: pd.DataFrame):
+    try:
+        pd.testing.assert_frame_equal(df, expected, check_categorical=False)
+    except AssertionError as e:
+        return str(e).strip().splitlines()[0]
+    # The order of the categories decides the row order of groupby results, so it has to match too
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            if not df[col].cat.categories.equals(expected[col].cat.categories):
+                return f"same records, but the categories of {col} are in a different order"
+    return None
+
+
+def compare_readers(gdx_path: str, symbols: list = None) -> dict:
+    """
+    Read symbols (every symbol in the file if None) with both readers and compare the records, without the columns
+    load_gdx_symbol drops. Returns symbol -> None if the records match, otherwise a description of the difference.
+    """
+    if symbols is None:
+        symbols = list(gt.Container(gdx_path).data)
+    transfer = read_transfer(gdx_path, symbols)
+    fast = read_numpy(gdx_path, symbols)
+    results = {}
+    for symbol in symbols:
+        if symbol not in transfer or symbol not in fast:
+            results[symbol] = f"only read by {'transfer' if symbol in transfer else 'numpy'}"
+            continue
+        expected = transfer[symbol].drop(columns=[c for c in UNUSED_COLUMNS if c in transfer[symbol].columns])
+        results[symbol] = _difference(fast[symbol].reset_index(drop=True), expected.reset_index(drop=True))
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("Usage: python gdx_reader.py <gdx file> [symbols]")
+    differences = compare_readers(sys.argv[1], sys.argv[2:] or None)
+    for symbol, difference in differences.items():
+        print(f"{symbol}: {'same' if difference is None else difference}")
+    if any(d is not None for d in differences.values()):
+        sys.exit(1)
@@ -0,0 +1,79 @@
+# Expanding segment level outputs to hours. REGEN solves each year on representative segments, and every hour of the
+# year belongs to one segment (hrep). Segment level values are stored once per segment, with the hour_segments output
+# holding the hour to segment mapping, and copied onto each hour only when an hourly view is asked for.
+import numpy as np
+import pandas as pd
+
+
+def expand_join(left: pd.DataFrame, right: pd.DataFrame, keys: list) -> pd.DataFrame:
+    """
+    Inner join of left with right, where right can have several rows for the same keys. Gives the same rows and columns
+    as left.merge(right, on=keys), in the same order (rows of left in order, each followed by its matching rows of right
+    in their order), but builds the result by gathering rows by position instead of with a hash join.
+    """
+    codes, uniques = pd.MultiIndex.from_frame(right[keys]).factorize()
+    # Rows of right grouped by key, keeping their order within each key
+    order = np.argsort(codes, kind="stable")
+    counts = np.bincount(codes, minlength=len(uniques))
+    starts = np.cumsum(counts) - counts
+
+    positions = uniques.get_indexer(pd.MultiIndex.from_frame(left[keys]))
+    found = positions >= 0
+    repeats = np.where(found, counts[np.where(found, positions, 0)], 0)
+    left_rows = np.repeat(np.arange(len(left)), repeats)
+    # Position of each output row within the matches of its left row
+    offsets = np.arange(len(left_rows)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    right_rows = order[starts[positions[left_rows]] + offsets]
+
+    others = [c for c in right.columns if c not in keys]
+    return pd.concat([left.take(left_rows).reset_index(drop=True),
+                      right[others].take(right_rows).reset_index(drop=True)], axis=1)
+
+
+class HourIndex:
+    """
+    Segment of every hour of each year, built from the hour_segments output (or rep_hours), for expanding segment level
+    outputs to hourly resolution.
+
+        index = HourIndex(pd.read_csv("../cleaned_data/reference/hour_segments.csv"))
+        hourly = index.expand(dispatch_by_segment_gwh)
+        index.segments(2030, [1, 2, 3])
+    """
+
+    def __init__(self, hour_segments: pd.DataFrame):
+        # The store holds a copy for every scenario; the mapping is the same for all of them
+        hour_segments = hour_segments[["year", "hour", "segment"]].drop_duplicates(ignore_index=True)
+        self.hour_segments = hour_segments
+        self._years = {}
+        for year, group in hour_segments.groupby(hour_segments["year"].astype(int), sort=True):
+            hours = group["hour"].astype(int).to_numpy()
+            segments = np.zeros(hours.max() + 1, dtype=group["segment"].astype(int).dtype)
+            segments[hours] = group["segment"].astype(int).to_numpy()
+            self._years[year] = segments
+
+    def years(self) -> list:
+        """
+        Years in the mapping.
+        """
+        return list(self._years)
+
+    def segments(self, year: int, hours) -> np.ndarray:
+        """
+        Segment of each of hours in year.
+        """
+        return np.take(self._years[int(year)], np.asarray(hours, dtype=np.int64))
+
+    def expand(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Hourly view of a segment level output (with year and segment columns): every row repeated for each hour of its
+        segment, with an hour column added. Same result as merging df with rep_hours on year and segment.
+        """
+        keys = ["year", "segment"]
+        # Rows read from the store have an empty hour column if other scenarios were stored hourly
+        if "hour" in df.columns:
+            df = df.drop(columns="hour")
+        right = self.hour_segments
+        # Outputs read back from csv or the store have integer years and segments rather than strings
+        if df["year"].dtype != right["year"].dtype or df["segment"].dtype != right["segment"].dtype:
+            right = right.astype({key: df[key].dtype for key in keys})
+        return expand_join(df, right[keys + ["hour"]], keys)
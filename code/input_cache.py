@@ -0,0 +1,170 @@
+# On-disk cache of inputs that are the same for every scenario in a regional aggregation (the hour to segment mapping
+# and the endusescen loads and availability factors), so each run reads them from one pickle instead of parsing and
+# aggregating the GDX files again.
+#
+# Each entry is a pickle of the records and a json file recording the source files it was built from. Entries are
+# keyed by the transform name, its arguments, the transform version and the sha256 of every source file, so an entry
+# built from files that have since changed is never used, and is removed when the next entry is saved.
+import os
+import json
+import glob
+import pickle
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from manifest import atomic_write, file_hash
+
+
+class InputCache:
+    """
+    Cached transforms of scenario independent GDX inputs in folder. Several processes can use the same folder at once:
+    entries are written to temporary files and moved into place, so a reader never sees a partial entry.
+    """
+
+    def __init__(self, folder: str, version: int):
+        self.folder = folder
+        self.version = version
+        os.makedirs(folder, exist_ok=True)
+        # Fingerprints computed by this process, so each source is only hashed once
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _entries(self) -> list:
+        """
+        Metadata of every entry in the folder.
+        """
+        entries = []
+        for path in glob.glob(os.path.join(self.folder, "*.json")):
+            try:
+                with open(path) as f:
+                    entries.append(json.load(f))
+            except (OSError, ValueError):
+                pass
+        return entries
+
+    def fingerprint(self, path: str) -> dict:
+        """
+        Size, mtime and sha256 of a source file. The file is only hashed if no entry records the same size and mtime.
+        """
+        with self._lock:
+            if path in self._fingerprints:
+                return self._fingerprints[path]
+        stat = os.stat(path)
+        fingerprint = None
+        for entry in self._entries():
+            previous = entry["sources"].get(path)
+            if previous and previous["size"] == stat.st_size and previous["mtime"] == stat.st_mtime:
+                fingerprint = {k: previous[k] for k in ("size", "mtime", "sha256")}
+                break
+        if fingerprint is None:
+            fingerprint = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": file_hash(path)}
+        with self._lock:
+            self._fingerprints[path] = fingerprint
+        return fingerprint
+
+    def key(self, name: str, sources: dict, args) -> str:
+        """
+        Key of the entry for transform name of sources (path -> symbols read) called with args, which must be
+        picklable. Arrays of labels in args are keyed by their sorted labels (see stable_args).
+        """
+        sha = hashlib.sha256()
+        sha.update(json.dumps({"name": name, "version": self.version,
+                               "sources": {path: [self.fingerprint(path)["sha256"], sorted(symbols)]
+                                           for path, symbols in sorted(sources.items())}}).encode())
+        sha.update(pickle.dumps(stable_args(args)))
+        return f"{name}_{sha.hexdigest()[:16]}"
+
+    def load(self, key: str):
+        """
+        Records stored under key, or None if there is no such entry.
+        """
+        path = os.path.join(self.folder, key + ".pkl")
+        try:
+            value = pd.read_pickle(path)
+        except Exception:
+            # Missing, or unreadable (written by another pandas version, or damaged). Rebuilt by the caller.
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def save(self, key: str, name: str, sources: dict, value):
+        """
+        Store value under key, and remove entries built from files that have since changed (see evict_stale).
+        Entries of the same transform with other arguments are kept.
+        """
+        self.evict_stale()
+        base = os.path.join(self.folder, key)
+        metadata = {"name": name, "version": self.version,
+                    "sources": {path: {**self.fingerprint(path), "symbols": sorted(symbols)}
+                                for path, symbols in sources.items()}}
+        # Other processes may be writing the same entry
+        atomic_write(base + ".pkl", lambda f: pd.to_pickle(value, f, protocol=pickle.HIGHEST_PROTOCOL), binary=True,
+                     unique=True)
+        atomic_write(base + ".json", lambda f: json.dump(metadata, f, indent=2), unique=True)
+
+    def evict_stale(self):
+        """
+        Remove the entries of another version or built from a source file that has changed or no longer exists, which
+        can never be used again.
+        """
+        for path in glob.glob(os.path.join(self.folder, "*.json")):
+            try:
+                with open(path) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                # Unreadable metadata, or replaced by another process
+                continue
+            if entry["version"] == self.version and all(self._current(source, fingerprint)
+                                                        for source, fingerprint in entry["sources"].items()):
+                continue
+            for stale in (path, path[:-len(".json")] + ".pkl"):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+    def _current(self, path: str, fingerprint: dict) -> bool:
+        """
+        Whether fingerprint (from an entry) is that of the current version of path.
+        """
+        return os.path.exists(path) and self.fingerprint(path)["sha256"] == fingerprint["sha256"]
+
+    def covers(self, path: str, symbol: str) -> bool:
+        """
+        Whether an entry was built from symbol in the current version of path, so the symbol probably does not need to
+        be read from the file.
+        """
+        if not os.path.exists(path):
+            return False
+        fingerprint = self.fingerprint(path)
+        for entry in self._entries():
+            source = entry["sources"].get(path)
+            if (entry["version"] == self.version and source and source["sha256"] == fingerprint["sha256"]
+                    and symbol in source["symbols"]):
+                return True
+        return False
+
+    def summary(self) -> str:
+        return f"input cache: {self.hits} hits, {self.misses} misses"
+
+
+def stable_args(args):
+    """
+    args with every array, Index, Series or Categorical (e.g. the California regions) replaced by its sorted labels as
+    strings, so the key does not depend on the dtype or the categories of the array, which for categoricals of a shared
+    domain grow as a process loads more symbols. Lists, tuples and dicts are converted element by element.
+    """
+    if isinstance(args, (np.ndarray, pd.Index, pd.Series, pd.Categorical)):
+        return ("labels", tuple(sorted(np.asarray(args, dtype=str))))
+    if isinstance(args, (list, tuple)):
+        return type(args)(stable_args(arg) for arg in args)
+    if isinstance(args, dict):
+        return {key: stable_args(value) for key, value in args.items()}
+    return args
@@ -0,0 +1,125 @@
+# Manifest of the outputs in a cleaned_data folder, used to only rebuild outputs whose GDX inputs have changed.
+import os
+import json
+import hashlib
+import threading
+
+MANIFEST_FILE = "manifest.json"
+
+
+def atomic_write(path: str, write, binary: bool = False, unique: bool = False):
+    """
+    Write path with write(f), a function writing to an open file, through a temporary file moved into place, so an
+    interrupted write cannot leave a partial file and readers never see one. Pass unique if other processes or threads
+    may write the same path at once, so each writes its own temporary file.
+    """
+    tmp_path = path + (f".{os.getpid()}.{threading.get_ident()}" if unique else "") + ".tmp"
+    with open(tmp_path, "wb" if binary else "w") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def file_hash(path: str, chunk_size: int = 2**24) -> str:
+    """
+    sha256 of a file, read in chunks so large GDX files are not loaded into memory.
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class Manifest:
+    """
+    Records, for each output in a folder, the GDX files and symbols it was built from, their size, mtime and hash,
+    and the transform version of the code that built it.
+    """
+
+    def __init__(self, folder: str, fingerprints: dict = None):
+        self.path = os.path.join(folder, MANIFEST_FILE)
+        self.folder = folder
+        self.outputs = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.outputs = json.load(f).get("outputs", {})
+        # Fingerprints computed during this run, so each source is only hashed once
+        self.fingerprints = dict(fingerprints or {})
+
+    def _previous_fingerprint(self, path: str, size: int, mtime: float):
+        """
+        Return a fingerprint recorded for path with the same size and mtime, so the file does not need to be hashed again.
+        """
+        for entry in self.outputs.values():
+            previous = entry.get("sources", {}).get(path)
+            if previous and previous["size"] == size and previous["mtime"] == mtime:
+                return {k: previous[k] for k in ("size", "mtime", "sha256")}
+        return None
+
+    def fingerprint(self, path: str):
+        """
+        Size, mtime and sha256 of a source file, or None if it does not exist.
+        The file is only hashed if its size or mtime differ from what is in the manifest.
+        """
+        if path not in self.fingerprints:
+            if not os.path.exists(path):
+                self.fingerprints[path] = None
+            else:
+                stat = os.stat(path)
+                self.fingerprints[path] = (self._previous_fingerprint(path, stat.st_size, stat.st_mtime)
+                                            or {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": file_hash(path)})
+        return self.fingerprints[path]
+
+    def stale_reason(self, output: str, file: str, sources: dict, version: int, layout: str = None):
+        """
+        Return why output needs to be rebuilt, or None if it is up to date.
+
+        Parameters:
+        output  (str)  : Output name.
+        file    (str)  : Output file name in the folder.
+        sources (dict) : path -> list of symbols the output is built from.
+        version (int)  : Transform version of the code that builds the output.
+        layout  (str, optional) : Layout of the output's rows when it can be written in several (e.g. "segment" for
+                                  segment level outputs, see --segment-outputs). Defaults to the normal layout.
+        """
+        entry = self.outputs.get(output)
+        if entry is None:
+            return "not in manifest"
+        if entry.get("file") != file:
+            return "output format changed"
+        if not os.path.exists(os.path.join(self.folder, file)):
+            return "output file missing"
+        if entry.get("transform_version") != version:
+            return "transform version changed"
+        if entry.get("layout") != layout:
+            return "output layout changed"
+        if set(entry.get("sources", {})) != set(sources):
+            return "source files changed"
+        for path, symbols in sources.items():
+            previous = entry["sources"][path]
+            if sorted(previous.get("symbols", [])) != sorted(symbols):
+                return f"symbols read from {os.path.basename(path)} changed"
+            current = self.fingerprint(path)
+            if current is None:
+                return f"{os.path.basename(path)} missing"
+            if current["sha256"] != previous.get("sha256"):
+                return f"{os.path.basename(path)} changed"
+        return None
+
+    def record(self, output: str, file: str, sources: dict, version: int, layout: str = None):
+        """
+        Record that output was rebuilt from sources. Call save to write the manifest.
+        """
+        self.outputs[output] = {
+            "file": file,
+            "transform_version": version,
+            "layout": layout,
+            "sources": {path: {**self.fingerprint(path), "symbols": sorted(symbols)}
+                        for path, symbols in sources.items() if self.fingerprint(path) is not None},
+        }
+
+    def save(self):
+        """
+        Write the manifest. Written to a temporary file first so an interrupted run cannot leave a corrupt manifest.
+        """
+        atomic_write(self.path, lambda f: json.dump({"outputs": self.outputs}, f, indent=2, sort_keys=True))
@@ -0,0 +1,58 @@
+# Vectorized value mappings. Each unique value is mapped once and the result is broadcast back to every row,
+# which is much faster than mapping row by row on hourly frames with millions of rows.
+import numpy as np
+import pandas as pd
+
+# (label, value) pairs already reported as unmapped, so each is only reported once per run
+_reported = set()
+
+
+def map_unique(values: pd.Series, func, label: str = None) -> pd.Series:
+    """
+    Map every value of a series with func, calling func once per unique value.
+
+    Parameters:
+    values (Series)        : Values to map. Categoricals are mapped on their categories.
+    func   (callable)      : Function of a single value, returning the mapped value or None / NaN if it has no mapping.
+    label  (str, optional) : Name of the mapping, used to report values without a mapping. Not reported if None.
+    Returns:
+    pd.Series: Mapped values with the same index as values. Values without a mapping are NaN.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    mapped = np.array([func(u) for u in uniques] + [np.nan], dtype=object)
+    # Missing values have code -1, which takes the trailing NaN
+    result = pd.Series(mapped.take(codes), index=values.index, name=values.name)
+    mapped = mapped[:-1]
+
+    if label is not None:
+        used = np.unique(codes[codes >= 0])
+        unmapped = sorted(str(uniques[i]) for i in used if pd.isna(mapped[i]))
+        new = [u for u in unmapped if (label, u) not in _reported]
+        if new:
+            _reported.update((label, u) for u in new)
+            print(f"No {label} mapping for {', '.join(new)}")
+    return result
+
+
+def map_dict(values: pd.Series, mapping: dict, label: str = None) -> pd.Series:
+    """
+    Vectorized values.map(mapping). Values not in mapping are NaN and are reported if label is given.
+    """
+    return map_unique(values, lambda x: mapping.get(x, np.nan), label)
+
+
+def keep_unique(values: pd.Series, func) -> np.ndarray:
+    """
+    Boolean mask of the values for which func returns True, calling func once per unique value (once per category for
+    categoricals). Missing values are never kept.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    # Missing values have code -1, which takes the trailing False
+    keep = np.array([bool(func(u)) for u in uniques] + [False])
+    return keep[codes]
@@ -0,0 +1,54 @@
+# Helpers for checking how much memory is available to the extraction
+import os
+import sys
+
+
+def available_memory():
+    """
+    Return the available system memory in bytes, or None if it cannot be determined.
+    Uses psutil when it is installed, otherwise falls back to sysconf (Linux and macOS).
+    """
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def current_rss():
+    """
+    Return the resident memory of this process in bytes, or None if it cannot be determined.
+    Uses psutil when it is installed, otherwise /proc (Linux).
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss():
+    """
+    Return the peak resident memory of this process so far in bytes, or None if it cannot be determined.
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset
+    except (ImportError, AttributeError):
+        return None
@@ -0,0 +1,179 @@
+# Output file formats. CSV is written as is; Parquet and Feather outputs use compact column types.
+# Every output is written to a temporary file that replaces the previous output once it is complete.
+import os
+import gzip
+import shutil
+import numpy as np
+import pandas as pd
+
+# File extension for each output format
+OUTPUT_FORMATS = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
+# Compression codecs, with the extension added to compressed csv files. Parquet and Feather files are compressed
+# internally and keep their extension.
+COMPRESSION = {"gzip": ".gz", "zstd": ".zst"}
+# Columns stored as small integers when every value is a whole number
+INTEGER_COLUMNS = ["year", "hour"]
+# Largest relative error allowed when storing a float column as float32
+FLOAT32_RTOL = 1e-6
+
+
+def output_file(name: str, fmt: str = "csv", partition_by_year: bool = False, compression: str = None) -> str:
+    """
+    File name of an output in the given format. Parquet outputs partitioned by year are a folder named after
+    the output, with one file per year. Compressed csv files end in .csv.gz or .csv.zst.
+    """
+    if partition_by_year and fmt == "parquet":
+        return name
+    if fmt == "csv" and compression is not None:
+        return name + OUTPUT_FORMATS[fmt] + COMPRESSION[compression]
+    return name + OUTPUT_FORMATS[fmt]
+
+
+def check_compression(fmt: str, compression: str = None):
+    """
+    Raise ValueError if outputs in format fmt cannot be compressed with compression.
+    """
+    if compression is None:
+        return
+    if compression not in COMPRESSION:
+        raise ValueError(f"Unknown compression {compression}. Compressions are: {', '.join(COMPRESSION)}")
+    if fmt == "feather" and compression != "zstd":
+        raise ValueError("Feather outputs can only be compressed with zstd")
+    if fmt == "csv" and compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd compressed csv outputs need the zstandard Python package")
+
+
+def _open_csv(path: str, compression: str = None):
+    """
+    Open path for writing csv text, compressed as a single stream so the file can be written in chunks.
+    zstd compresses on every core.
+    """
+    if compression == "gzip":
+        return gzip.open(path, "wt", encoding="utf-8", newline="")
+    if compression == "zstd":
+        import zstandard
+        return zstandard.open(path, "w", cctx=zstandard.ZstdCompressor(threads=-1), encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def _remove(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def compact_types(df: pd.DataFrame, float32: bool = True) -> pd.DataFrame:
+    """
+    Return a copy of df with compact column types for columnar formats:
+    string columns (tech, region, segment, ...) are dictionary encoded as categoricals,
+    year and hour are stored as int16, and float columns are stored as float32 if no value changes by more than FLOAT32_RTOL
+    (unless float32 is False).
+    """
+    df = df.reset_index(drop=True)
+    for col in df.columns:
+        values = df[col]
+        if col in INTEGER_COLUMNS:
+            numbers = pd.to_numeric(values.astype(str), errors="coerce")
+            if numbers.notna().all() and (numbers % 1 == 0).all() and numbers.abs().max() < 2**15:
+                df[col] = numbers.astype("int16")
+                continue
+        if values.dtype == object or pd.api.types.is_string_dtype(values.dtype):
+            df[col] = values.astype("category")
+        elif isinstance(values.dtype, pd.CategoricalDtype):
+            df[col] = values.cat.remove_unused_categories()
+        elif float32 and values.dtype == np.float64:
+            narrow = values.astype(np.float32)
+            if np.allclose(narrow, values, rtol=FLOAT32_RTOL, atol=0, equal_nan=True):
+                df[col] = narrow
+    return df
+
+
+def write_output_file(df, folder: str, name: str, fmt: str = "csv", partition_by_year: bool = False,
+                      compression: str = None) -> str:
+    """
+    Write an output to folder. Returns the name of the file, or of the folder if partitioned by year.
+    The output is written to a temporary file first, so an interrupted or failed write leaves the previous output in place.
+
+    Parameters:
+    df                (DataFrame)      : The output, or an iterable of DataFrames with the same columns that are written
+                                         one at a time (all at once for feather, which cannot be appended to).
+    folder            (str)            : Folder to write to.
+    name              (str)            : Output name, used as the file name.
+    fmt               (str, optional)  : csv, parquet or feather. Defaults to csv.
+    partition_by_year (bool, optional) : Write parquet outputs as a folder with one file per year. Outputs without a
+                                         year column are written as a single file in the folder. Defaults to False.
+    compression       (str, optional)  : gzip or zstd (see check_compression). Defaults to uncompressed csv and
+                                         feather files, and snappy compressed parquet files.
+    """
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {fmt}. Formats are: {', '.join(OUTPUT_FORMATS)}")
+    check_compression(fmt, compression)
+    file = output_file(name, fmt, partition_by_year, compression)
+    path = os.path.join(folder, file)
+    tmp_path = path + ".tmp"
+    _remove(tmp_path)
+    try:
+        _write(df, tmp_path, fmt, partition_by_year, compression)
+    except BaseException:
+        _remove(tmp_path)
+        raise
+    if os.path.isdir(path):
+        # A folder cannot be replaced in one step, so move the previous dataset aside first. Years that are no longer
+        # in the output do not linger.
+        _remove(path + ".old")
+        os.replace(path, path + ".old")
+        os.replace(tmp_path, path)
+        shutil.rmtree(path + ".old")
+    else:
+        os.replace(tmp_path, path)
+    return file
+
+
+def _write(df, path: str, fmt: str, partition_by_year: bool, compression: str):
+    chunks = [df] if isinstance(df, pd.DataFrame) else df
+
+    if fmt == "csv":
+        with _open_csv(path, compression) as f:
+            for i, chunk in enumerate(chunks):
+                chunk.to_csv(f, index = False, header = i == 0)
+        return
+
+    if fmt == "feather":
+        df = compact_types(pd.concat(chunks, ignore_index=True))
+        # Column names of pivoted outputs are years, which Feather needs as strings
+        df.columns = [str(col) for col in df.columns]
+        if compression is None:
+            df.to_feather(path)
+        else:
+            df.to_feather(path, compression = compression)
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    compression = compression or "snappy"
+    if partition_by_year:
+        os.makedirs(path)
+    writer = None
+    try:
+        for i, chunk in enumerate(chunks):
+            chunk = compact_types(chunk)
+            # Column names of pivoted outputs are years, which Parquet needs as strings
+            chunk.columns = [str(col) for col in chunk.columns]
+            if partition_by_year and "year" in chunk.columns:
+                # Each call adds new files to the year folders
+                chunk.to_parquet(path, index = False, partition_cols = ["year"], compression = compression)
+            elif partition_by_year:
+                chunk.to_parquet(os.path.join(path, f"part-{i}.parquet"), index = False, compression = compression)
+            else:
+                table = pa.Table.from_pandas(chunk, preserve_index = False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema, compression = compression)
+                # Later chunks are stored with the column types of the first
+                writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
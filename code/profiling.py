@@ -0,0 +1,188 @@
+# Per stage timing and memory instrumentation of an extraction run, written as a JSON report and a summary table.
+import os
+import io
+import json
+import time
+import cProfile
+import pstats
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from memory import current_rss, peak_rss
+from manifest import atomic_write
+
+REPORT_FILE = "profile_report.json"
+
+
+def rows(value):
+    """
+    Number of rows of a DataFrame (or anything with a shape), otherwise None.
+    """
+    shape = getattr(value, "shape", None)
+    return shape[0] if shape else None
+
+
+class Profiler:
+    """
+    Records wall time, CPU time, resident memory, rows in and out, and bytes read and written for each stage of a
+    scenario, and rows and memory for each GDX symbol. Stages can be nested; self_wall_s leaves out nested stages.
+    Stages can also be recorded from other threads (background output writes), each thread with its own nesting.
+
+    If dump_folder is given, every top level stage of the main thread also runs under cProfile and tracemalloc, and the profile and
+    largest allocations of the slowest stage are written to dump_folder. This slows the run down considerably.
+    """
+
+    def __init__(self, scenario: str, dump_folder: str = None):
+        self.scenario = scenario
+        self.dump_folder = dump_folder
+        self.stages = []
+        self.symbols = []
+        self._local = threading.local()
+        self._slowest = None
+        self._start = time.perf_counter()
+        if dump_folder is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @property
+    def _stack(self) -> list:
+        # Stages currently open in this thread
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def stage(self, name: str, kind: str, rows_in: int = None):
+        """
+        Record a stage. Yields the stage record so the caller can add rows_out, bytes_read and bytes_written.
+        """
+        record = {"stage": name, "kind": kind, "rows_in": rows_in, "rows_out": None,
+                  "bytes_read": 0, "bytes_written": 0, "_child_wall": 0.0}
+        # Only one cProfile profiler can run at a time, so stages in other threads are not profiled
+        top_level = not self._stack and threading.current_thread() is threading.main_thread()
+        profile = cProfile.Profile() if self.dump_folder is not None and top_level else None
+        self._stack.append(record)
+        rss_start, peak_start = current_rss(), peak_rss()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        if profile is not None:
+            tracemalloc.reset_peak()
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile is not None:
+                profile.disable()
+            wall = time.perf_counter() - wall_start
+            rss_end, peak_end = current_rss(), peak_rss()
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1]["_child_wall"] += wall
+            record["wall_s"] = wall
+            record["self_wall_s"] = wall - record.pop("_child_wall")
+            record["cpu_s"] = time.process_time() - cpu_start
+            record["rss_end_mb"] = rss_end / 1e6 if rss_end is not None else None
+            # The process peak only shows the stage's own peak if the stage raised it. Otherwise use the change in
+            # resident memory, a lower bound.
+            if None in (rss_start, rss_end):
+                record["peak_rss_delta_mb"] = None
+            elif peak_start is not None and peak_end is not None and peak_end > peak_start:
+                record["peak_rss_delta_mb"] = (peak_end - rss_start) / 1e6
+            else:
+                record["peak_rss_delta_mb"] = max(rss_end - rss_start, 0) / 1e6
+            self.stages.append(record)
+            if profile is not None and (self._slowest is None or wall > self._slowest[0]):
+                self._slowest = (wall, name, profile, tracemalloc.take_snapshot())
+
+    def add_rows_in(self, n: int):
+        """
+        Add rows loaded inside the current stage (e.g. from GDX) to its rows in.
+        """
+        if self._stack and n is not None:
+            record = self._stack[-1]
+            record["rows_in"] = (record["rows_in"] or 0) + n
+
+    def symbol(self, path: str, symbol: str, records, read_s: float):
+        """
+        Record a GDX symbol read from path. read_s is the time to read the file, which is shared by the symbols read
+        in the same pass.
+        """
+        self.symbols.append({"file": os.path.basename(path), "symbol": symbol, "rows": rows(records),
+                             "memory_bytes": int(records.memory_usage(deep=True).sum()), "file_read_s": read_s})
+
+    def call_step(self, name: str, func, kwargs: dict):
+        """
+        Run a pipeline step as a stage. Passed to Graph.run.
+        """
+        rows_in = [rows(value) for value in kwargs.values()]
+        with self.stage(name, "step", sum(n for n in rows_in if n is not None)) as record:
+            value = func(**kwargs)
+            record["rows_out"] = rows(value)
+        return value
+
+    def dump(self) -> list:
+        """
+        Write the cProfile stats and largest allocations of the slowest stage to dump_folder. Returns the files written.
+        """
+        if self.dump_folder is None or self._slowest is None:
+            return []
+        wall, name, profile, snapshot = self._slowest
+        os.makedirs(self.dump_folder, exist_ok=True)
+        base = os.path.join(self.dump_folder, f"{self.scenario}_{name}".replace(" ", "_"))
+        profile.dump_stats(base + ".prof")
+        text = io.StringIO()
+        pstats.Stats(profile, stream=text).sort_stats("cumulative").print_stats(30)
+        with open(base + "_profile.txt", "w") as f:
+            f.write(f"{name}: {wall:.2f} s\n{text.getvalue()}")
+        with open(base + "_tracemalloc.txt", "w") as f:
+            f.write(f"Largest allocations alive at the end of {name}\n")
+            for stat in snapshot.statistics("lineno")[:30]:
+                f.write(f"{stat}\n")
+        return [base + ".prof", base + "_profile.txt", base + "_tracemalloc.txt"]
+
+    def report(self) -> dict:
+        """
+        Machine readable report of the scenario.
+        """
+        return {"scenario": self.scenario, "wall_s": time.perf_counter() - self._start,
+                "stages": self.stages, "symbols": self.symbols, "dumps": self.dump()}
+
+
+def combine_reports(reports: list, wall_s: float) -> dict:
+    """
+    Combine scenario reports into a run report, with the stages totalled over scenarios.
+    """
+    totals = {}
+    for report in reports:
+        for stage in report["stages"]:
+            total = totals.setdefault(stage["stage"], {"stage": stage["stage"], "kind": stage["kind"], "count": 0,
+                                                       "wall_s": 0.0, "self_wall_s": 0.0, "cpu_s": 0.0, "max_wall_s": 0.0,
+                                                       "peak_rss_delta_mb": 0.0, "rows_in": 0, "rows_out": 0,
+                                                       "bytes_read": 0, "bytes_written": 0})
+            total["count"] += 1
+            total["max_wall_s"] = max(total["max_wall_s"], stage["wall_s"])
+            total["peak_rss_delta_mb"] = max(total["peak_rss_delta_mb"], stage["peak_rss_delta_mb"] or 0)
+            for key in ("wall_s", "self_wall_s", "cpu_s", "rows_in", "rows_out", "bytes_read", "bytes_written"):
+                total[key] += stage[key] or 0
+    stages = sorted(totals.values(), key=lambda s: -s["self_wall_s"])
+    return {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "wall_s": wall_s, "stages": stages,
+            "scenarios": {report["scenario"]: report for report in reports}}
+
+
+def summary_table(run_report: dict, top: int = 25) -> str:
+    """
+    Human readable table of the stages that took the longest, totalled over scenarios.
+    """
+    header = (f"{'stage':<34}{'kind':<6}{'n':>4}{'self s':>9}{'wall s':>9}{'cpu s':>9}{'peak MB':>9}"
+              f"{'rows in':>12}{'rows out':>12}{'MB read':>9}{'MB written':>11}")
+    lines = [f"Run time {run_report['wall_s']:.1f} s. Stages by time, excluding nested stages:", header, "-" * len(header)]
+    for s in run_report["stages"][:top]:
+        lines.append(f"{s['stage'][:33]:<34}{s['kind']:<6}{s['count']:>4}{s['self_wall_s']:>9.2f}{s['wall_s']:>9.2f}"
+                     f"{s['cpu_s']:>9.2f}{s['peak_rss_delta_mb']:>9.1f}{s['rows_in']:>12,}{s['rows_out']:>12,}"
+                     f"{s['bytes_read'] / 1e6:>9.1f}{s['bytes_written'] / 1e6:>11.1f}")
+    return "\n".join(lines)
+
+
+def save_report(run_report: dict, path: str):
+    """
+    Write the run report as JSON, through a temporary file so an interrupted run cannot leave a partial report.
+    """
+    atomic_write(path, lambda f: json.dump(run_report, f, indent=2))
@@ -0,0 +1,61 @@
+# Aggregation of outputs by region to the aggregate regions above them (California, ca / rest_of_wecc, WECC, ...).
+# A hierarchy is a dictionary of level -> {region: aggregate region}, with None for the regions themselves:
+#
+#   levels = {"region": None, "california": {r: "California" for r in cal_r}, "state": STATE_MAPPING}
+#   by_level = rollup(capacity, ["tech", "region", "year"], {"capacity": "sum"}, levels)
+#
+# Regions without an aggregate in a level are left out of that level.
+import pandas as pd
+from mapping import map_dict
+
+# Aggregations that give the same result whether applied to the rows or to the groups of a finer level
+ROLLUP_AGGREGATIONS = ["sum", "min", "max"]
+
+
+def rollup(df: pd.DataFrame, keys: list, agg: dict, levels: dict, regions: list = None, grouped: bool = False,
+           report_unmapped: bool = False) -> dict:
+    """
+    Aggregate df to every level of a region hierarchy. The rows are grouped once by keys, and each aggregate level is
+    built from those groups, so adding a level does not add another pass over the rows. With a single aggregate level
+    and no base level the rows are grouped straight to that level instead.
+
+    Parameters:
+    df      (DataFrame)        : Rows to aggregate.
+    keys    (list)             : Columns to group by, including the region columns. Their order is the column and
+                                 sort order of the results.
+    agg     (dict)             : column -> aggregation, one of ROLLUP_AGGREGATIONS.
+    levels  (dict)             : level -> {region: aggregate region}, or None for the regions themselves.
+    regions (list, optional)   : Region columns mapped at each level. Defaults to ["region"].
+    grouped (bool, optional)   : df already has one row per keys (e.g. an output by region), so it is not grouped
+                                 again and is the base level as is. Defaults to False.
+    report_unmapped (bool, optional) : Print regions without an aggregate, as map_dict does. Defaults to False.
+    Returns:
+    dict: level -> DataFrame with the keys (region columns holding the aggregate regions) and the aggregated columns.
+    """
+    regions = regions or ["region"]
+    unsupported = {how for how in agg.values() if how not in ROLLUP_AGGREGATIONS}
+    if unsupported:
+        raise ValueError(f"Cannot roll up {', '.join(sorted(unsupported))}. Aggregations are: {', '.join(ROLLUP_AGGREGATIONS)}")
+    aggregates = [level for level, mapping in levels.items() if mapping is not None]
+    if grouped or (len(aggregates) == 1 and len(levels) == 1):
+        base = df
+    else:
+        base = df.groupby(keys, observed=True).agg(agg).reset_index()
+
+    results = {}
+    for level, mapping in levels.items():
+        if mapping is None:
+            results[level] = base
+            continue
+        mapped = base.assign(**{col: map_dict(base[col], mapping, col if report_unmapped else None) for col in regions})
+        # Rows of regions without an aggregate have a missing key and are dropped by groupby
+        results[level] = mapped.groupby(keys, observed=True).agg(agg).reset_index()
+    return results
+
+
+def to_wide(df: pd.DataFrame, columns: str, values: str) -> pd.DataFrame:
+    """
+    Pivot a rollup level to one column per value of columns (e.g. year), indexed by the other columns.
+    """
+    index = [c for c in df.columns if c not in (columns, values)]
+    return df.pivot_table(index=index, columns=columns, values=values, observed=True).reset_index()
@@ -0,0 +1,161 @@
+# Column types of loaded GDX symbols. Every symbol is normalized right after it is loaded, so the same domain has the
+# same type wherever it comes from:
+#
+#   years (t) and hours (h)                       : int16
+#   segments, regions, tech classes, vintages, ... : categoricals, with the categories of a domain shared by every frame
+#   values and levels                              : float64, or the type in VALUE_TYPES for the symbol
+#
+# GDX readers give domain columns as categoricals (or strings) of the element labels, and anything else is an error.
+import threading
+import numpy as np
+import pandas as pd
+
+# Domain of each column, by GDX domain label (with or without the _<position> suffix gams.transfer adds when a label
+# repeats) and by the name the pipeline renames it to
+DOMAINS = {"t": "year", "year": "year",
+           "h": "hour", "hour": "hour",
+           "s": "segment", "segment": "segment",
+           "r": "region", "region": "region",
+           "i": "tech_class", "j": "tech_class", "tech_class": "tech_class",
+           "v": "vintage", "vintage": "vintage",
+           "f": "fuel", "fuel": "fuel"}
+# Domains of columns whose GDX domain is a catch-all (* as uni) or does not say what the labels are, by symbol
+SYMBOL_DOMAINS = {"vrsc": {"uni": "tech_class"},
+                  "gencaprpt": {"uni_0": "region", "grc_1": "report_tech", "uni_3": "unit"},
+                  "dspsrpt_r": {"uni_0": "balance", "uni_3": "balance_type"}}
+INTEGER_DOMAINS = ["year", "hour"]
+VALUE_COLUMNS = ["value", "level"]
+# Value type of symbols that do not need float64. Availability factors are fractions known to a few digits.
+VALUE_TYPES = {"vrsc": np.float32}
+
+
+def domain(col: str, symbol: str = None) -> str:
+    """
+    Domain of a column: its entry in SYMBOL_DOMAINS for symbol, then its entry in DOMAINS, otherwise the GDX domain
+    label itself (e.g. uni for *).
+    """
+    if col in SYMBOL_DOMAINS.get(symbol, {}):
+        return SYMBOL_DOMAINS[symbol][col]
+    base = col.rsplit("_", 1)[0] if col.rsplit("_", 1)[-1].isdigit() else col
+    return DOMAINS.get(col, DOMAINS.get(base, base))
+
+
+def _label_order(label: str):
+    # Numeric labels (segments 1, 2, ..., 100) sort as numbers and before other labels
+    return (0, int(label), "") if label.isdigit() else (1, 0, label)
+
+
+def _labels(values: pd.Series):
+    """
+    Codes and unique labels of a column of element labels. Raises TypeError for any other type.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    if values.dtype == object or pd.api.types.is_string_dtype(values.dtype):
+        return pd.factorize(values)
+    raise TypeError(f"Column {values.name} has type {values.dtype}, expected element labels (categorical or strings)")
+
+
+class Schema:
+    """
+    Categories of every label domain seen so far. A frame's categorical columns use the categories of their domain at
+    the time it is normalized, sorted so the order does not depend on which symbol was loaded first. Frames normalized
+    after a domain last gained a label share one dtype, so pandas joins and groups them on the integer codes.
+    """
+
+    def __init__(self):
+        self._labels = {}
+        self._dtypes = {}
+        self._lock = threading.Lock()
+
+    def dtype(self, name: str, labels) -> pd.CategoricalDtype:
+        """
+        Categorical type of domain name, after adding labels to it.
+        """
+        with self._lock:
+            known = self._labels.setdefault(name, set())
+            new = [str(label) for label in labels if str(label) not in known]
+            if new or name not in self._dtypes:
+                known.update(new)
+                self._dtypes[name] = pd.CategoricalDtype(sorted(known, key=_label_order))
+            return self._dtypes[name]
+
+    def labels(self, values: pd.Series, name: str) -> pd.Categorical:
+        """
+        Column of element labels as a categorical of the shared categories of domain name.
+        """
+        codes, uniques = _labels(values)
+        dtype = self.dtype(name, uniques)
+        # Unordered categorical types compare equal whatever the order of their categories, so compare the categories
+        if isinstance(values.dtype, pd.CategoricalDtype) and values.cat.categories.equals(dtype.categories):
+            return values.array
+        positions = dtype.categories.get_indexer(uniques.astype(str))
+        # Missing values have code -1, which takes the trailing -1
+        return pd.Categorical.from_codes(np.append(positions, -1)[codes], dtype=dtype)
+
+    def normalize(self, df: pd.DataFrame, symbol: str) -> pd.DataFrame:
+        """
+        Cast the columns of a symbol's records to their schema types. Raises TypeError for a column of an unexpected
+        type, and ValueError for years or hours that are not integers.
+        """
+        columns = {}
+        for col in df.columns:
+            values = df[col]
+            if col in VALUE_COLUMNS:
+                if not pd.api.types.is_float_dtype(values.dtype):
+                    raise TypeError(f"{symbol}: column {col} has type {values.dtype}, expected floats")
+                columns[col] = values.astype(VALUE_TYPES.get(symbol, np.float64), copy=False)
+                continue
+            try:
+                if domain(col, symbol) in INTEGER_DOMAINS:
+                    columns[col] = integers(values, f"{symbol}: {col}")
+                else:
+                    columns[col] = self.labels(values, domain(col, symbol))
+            except TypeError as e:
+                raise TypeError(f"{symbol}: {e}") from None
+        return pd.DataFrame(columns, index=df.index)
+
+    def conform(self, df: pd.DataFrame, symbol: str = None) -> pd.DataFrame:
+        """
+        Recode the categorical columns of a frame built from normalized records to the current shared categories, e.g.
+        for frames built in another process or run (see input_cache.py). Pass symbol for the records of a symbol whose
+        columns are still named by GDX domain. Other columns are left as they are.
+        """
+        recoded = {col: self.labels(df[col], domain(col, symbol)) for col in df.columns
+                   if isinstance(df[col].dtype, pd.CategoricalDtype)}
+        return df.assign(**recoded) if recoded else df
+
+    def merge(self, left: pd.DataFrame, right: pd.DataFrame, on: list, **kwargs) -> pd.DataFrame:
+        """
+        left.merge(right, on=on) for frames built from normalized records. Both are first recoded to the current shared
+        categories (see conform), so label keys have equal dtypes and are joined on their integer codes. Raises
+        TypeError if a label key of the result is no longer categorical, e.g. a column from a domain missing from
+        SYMBOL_DOMAINS.
+        """
+        merged = self.conform(left).merge(self.conform(right), on=on, **kwargs)
+        lost = [key for key in on if domain(key) not in INTEGER_DOMAINS
+                and not isinstance(merged[key].dtype, pd.CategoricalDtype)]
+        if lost:
+            raise TypeError(f"Merge keys {', '.join(lost)} are not categorical after merging; their domains differ")
+        return merged
+
+
+def integers(values: pd.Series, label: str) -> np.ndarray:
+    """
+    Column of integer element labels (years, hours) as int16. Already integer columns are only narrowed.
+    """
+    if pd.api.types.is_integer_dtype(values.dtype):
+        numbers, codes = values.to_numpy(dtype=float), None
+    else:
+        codes, uniques = _labels(values)
+        if (codes < 0).any():
+            raise ValueError(f"{label} has missing values")
+        numbers = pd.to_numeric(pd.Index(uniques).astype(str), errors="coerce").to_numpy(dtype=float)
+    if len(numbers) and not (np.isfinite(numbers).all() and (numbers % 1 == 0).all() and np.abs(numbers).max() < 2**15):
+        raise ValueError(f"{label} has labels that are not integers below {2**15}")
+    numbers = numbers.astype(np.int16)
+    return numbers if codes is None else numbers[codes]
+
+
+# Schema shared by every symbol loaded in this process
+schema = Schema()
@@ -0,0 +1,212 @@
+# Consolidated SQLite store of the outputs of every scenario, so comparisons across scenarios read one indexed file
+# instead of a csv per scenario.
+#
+#   from store import OutputStore
+#   store = OutputStore("../cleaned_data/outputs.sqlite")
+#   investment = store.query("ca_investment", scenarios=["reference", "base"], years=[2030, 2040])
+import os
+import sqlite3
+from contextlib import closing
+from itertools import repeat
+import pandas as pd
+from output_formats import compact_types
+
+STORE_FILE = "outputs.sqlite"
+# Columns indexed in every table that has them
+INDEX_COLUMNS = ["scenario", "year", "tech", "region"]
+# Table recording which outputs are stored for each scenario
+OUTPUTS_TABLE = "_outputs"
+# Temporary table an output is staged in before it is copied into the store
+STAGE_TABLE = "_stage"
+
+
+def _quote(name) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _sql_type(dtype) -> str:
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+
+class OutputStore:
+    """
+    SQLite file with one table per output holding the rows of every scenario, with a scenario column and an index on
+    (scenario, year, tech, region), or whichever of those columns the output has. Years and hours are stored as integers.
+    Several processes can write to the store at once; each waits up to timeout seconds for the others.
+    """
+
+    def __init__(self, path: str, timeout: float = 600):
+        self.path = path
+        self.timeout = timeout
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=self.timeout)
+
+    def _columns(self, con, name: str, schema: str = "main") -> list:
+        return [row[1] for row in con.execute(f"PRAGMA {schema}.table_info({_quote(name)})")]
+
+    def tables(self) -> list:
+        """
+        Outputs in the store.
+        """
+        if not os.path.exists(self.path):
+            return []
+        with closing(self._connect()) as con:
+            rows = con.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name != ?", (OUTPUTS_TABLE,))
+            return sorted(row[0] for row in rows)
+
+    def outputs(self, scenario: str) -> set:
+        """
+        Outputs stored for scenario.
+        """
+        if not os.path.exists(self.path):
+            return set()
+        with closing(self._connect()) as con:
+            try:
+                rows = con.execute(f"SELECT output FROM {OUTPUTS_TABLE} WHERE scenario = ?", (scenario,)).fetchall()
+            except sqlite3.OperationalError:
+                return set()
+        return {row[0] for row in rows}
+
+    def scenarios(self, name: str = None) -> list:
+        """
+        Scenarios in the store, or only those with output name.
+        """
+        if not os.path.exists(self.path):
+            return []
+        with closing(self._connect()) as con:
+            try:
+                if name is None:
+                    rows = con.execute(f"SELECT DISTINCT scenario FROM {OUTPUTS_TABLE}")
+                else:
+                    rows = con.execute(f"SELECT scenario FROM {OUTPUTS_TABLE} WHERE output = ?", (name,))
+                return sorted(row[0] for row in rows)
+            except sqlite3.OperationalError:
+                return []
+
+    def writer(self, scenario: str, name: str, df):
+        """
+        Store df as the rows of scenario in table name, replacing the rows stored for scenario before. Yields each chunk
+        once it is stored, so an output can be written to its file and to the store in one pass:
+
+            write_output_file(store.writer(scen, name, df), folder, name)
+
+        Chunks are staged in a temporary table of this connection, which does not lock the store, and copied into
+        table name in one short transaction once every chunk has been staged, so other writers only wait for the copy.
+
+        Parameters:
+        scenario (str)                 : Scenario name, stored in the scenario column.
+        name     (str)                 : Output name, used as the table name.
+        df       (DataFrame, iterable) : The output, or an iterable of DataFrames with the same columns.
+        """
+        chunks = [df] if isinstance(df, pd.DataFrame) else df
+        con = self._connect()
+        con.isolation_level = None
+        try:
+            con.execute(f"DROP TABLE IF EXISTS temp.{STAGE_TABLE}")
+            for chunk in chunks:
+                con.execute("BEGIN")
+                self._insert(con, scenario, STAGE_TABLE, chunk, "temp")
+                con.execute("COMMIT")
+                yield chunk
+            staged = con.execute(f"PRAGMA temp.table_info({STAGE_TABLE})").fetchall()
+
+            # Take the write lock up front so concurrent writers wait for each other instead of failing
+            con.execute("BEGIN IMMEDIATE")
+            con.execute(f"CREATE TABLE IF NOT EXISTS {OUTPUTS_TABLE} (scenario TEXT, output TEXT, PRIMARY KEY (scenario, output))")
+            con.execute(f"DELETE FROM {OUTPUTS_TABLE} WHERE scenario = ? AND output = ?", (scenario, name))
+            if self._columns(con, name):
+                con.execute(f"DELETE FROM {_quote(name)} WHERE scenario = ?", (scenario,))
+            if staged:
+                # row[1] and row[2] are the name and type of each column
+                self._create(con, name, [(row[1], row[2]) for row in staged if row[1] != "scenario"])
+                columns = ", ".join(_quote(row[1]) for row in staged)
+                con.execute(f"INSERT INTO {_quote(name)} ({columns}) SELECT {columns} FROM temp.{STAGE_TABLE}")
+                self._index(con, name)
+            con.execute(f"INSERT INTO {OUTPUTS_TABLE} VALUES (?, ?)", (scenario, name))
+            con.execute("COMMIT")
+        except BaseException:
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+            raise
+        finally:
+            con.close()
+
+    def write(self, scenario: str, name: str, df):
+        """
+        Store df as the rows of scenario in table name. See writer.
+        """
+        for _ in self.writer(scenario, name, df):
+            pass
+
+    def _create(self, con, name: str, columns: list, schema: str = "main"):
+        """
+        Create table name with a scenario column and columns, a list of (column, SQL type), or add the columns it is
+        missing.
+        """
+        existing = self._columns(con, name, schema)
+        table = f"{schema}.{_quote(name)}"
+        if not existing:
+            definitions = ", ".join(f"{_quote(col)} {sql_type}" for col, sql_type in columns)
+            con.execute(f"CREATE TABLE {table} (scenario TEXT, {definitions})")
+            return
+        # Pivoted outputs can have different year columns in each scenario
+        for col, sql_type in columns:
+            if col not in existing:
+                con.execute(f"ALTER TABLE {table} ADD COLUMN {_quote(col)} {sql_type}")
+
+    def _insert(self, con, scenario: str, name: str, df: pd.DataFrame, schema: str = "main"):
+        df = compact_types(df, float32=False)
+        df.columns = [str(col) for col in df.columns]
+        self._create(con, name, [(col, _sql_type(df[col].dtype)) for col in df.columns], schema)
+        insert_columns = ", ".join(_quote(col) for col in ["scenario"] + list(df.columns))
+        placeholders = ", ".join("?" * (len(df.columns) + 1))
+        values = [df[col].tolist() for col in df.columns]
+        con.executemany(f"INSERT INTO {schema}.{_quote(name)} ({insert_columns}) VALUES ({placeholders})",
+                        zip(repeat(scenario, len(df)), *values))
+
+    def _index(self, con, name: str):
+        columns = [col for col in INDEX_COLUMNS if col in self._columns(con, name)]
+        con.execute(f"CREATE INDEX IF NOT EXISTS {_quote(name + '_' + '_'.join(columns))} "
+                    f"ON {_quote(name)} ({', '.join(_quote(col) for col in columns)})")
+
+    def query(self, name: str, scenarios: list = None, years: list = None, techs: list = None, regions: list = None,
+              columns: list = None, distinct: bool = False) -> pd.DataFrame:
+        """
+        Rows of an output for every scenario in the store, filtered in the database.
+
+        Parameters:
+        name      (str)            : Output name, e.g. ca_investment.
+        scenarios (list, optional) : Only these scenarios. Defaults to every scenario.
+        years     (list, optional) : Only these years. Defaults to every year.
+        techs     (list, optional) : Only these techs. Defaults to every tech.
+        regions   (list, optional) : Only these regions. Defaults to every region.
+        columns   (list, optional) : Only return these columns. Defaults to every column.
+        distinct  (bool)           : Return each distinct row once, e.g. segment values expanded to every hour when
+                                     columns leaves out hour.
+        Returns:
+        pd.DataFrame: The matching rows, with a scenario column.
+        """
+        with closing(self._connect()) as con:
+            available = self._columns(con, name)
+            if not available:
+                raise KeyError(f"{name} is not in {self.path}. Outputs are: {', '.join(self.tables())}")
+            filters = {"scenario": scenarios, "year": years, "tech": techs, "region": regions}
+            where, params = [], []
+            for col, values in filters.items():
+                if values is None:
+                    continue
+                if col not in available:
+                    raise ValueError(f"{name} has no {col} column to filter on")
+                values = [values] if pd.api.types.is_scalar(values) else list(values)
+                where.append(f"{_quote(col)} IN ({', '.join('?' * len(values))})")
+                params += values
+            select = ", ".join(_quote(col) for col in columns) if columns else "*"
+            if distinct:
+                select = "DISTINCT " + select
+            sql = f"SELECT {select} FROM {_quote(name)}" + (" WHERE " + " AND ".join(where) if where else "")
+            return pd.read_sql_query(sql, con, params=params)
@@ -0,0 +1,131 @@
+# Summaries of hourly values for the figures of 3_hour_and_segments.r: net load, profiles by hour of day and month,
+# duration curves and rankings of hours by net load. Values are held as dense year x hour arrays, so each summary is a
+# sort, a gather or a mean along the hour axis instead of a groupby over long tables:
+#
+#   grid = YearHourGrid(rep_hours)
+#   load = grid.values(h_load, "load_h")
+#   table = grid.frame(load=load, rank=descending_rank(load))
+import numpy as np
+import pandas as pd
+
+HOURS_PER_DAY = 24
+# REGEN hour 1 is midnight on January 1st, in a year starting on the same day of the week as 2026
+CALENDAR_START = np.datetime64("2026-01-01T00", "h")
+
+
+def hour_of_day(hours) -> np.ndarray:
+    """
+    Hour of the day (0 to 23) of REGEN hours (1 to 8760).
+    """
+    return (np.asarray(hours, dtype=np.int64) - 1) % HOURS_PER_DAY
+
+
+def month(hours) -> np.ndarray:
+    """
+    Month (1 to 12) of REGEN hours (1 to 8760).
+    """
+    times = CALENDAR_START + (np.asarray(hours, dtype=np.int64) - 1).astype("timedelta64[h]")
+    return times.astype("datetime64[M]").astype(np.int64) % 12 + 1
+
+
+def descending_rank(values: np.ndarray) -> np.ndarray:
+    """
+    Rank of each value within its row, 1 for the largest. Equal values are ranked in hour order.
+    """
+    order = np.argsort(-values, axis=1, kind="stable")
+    ranks = np.empty(values.shape, dtype=np.int16)
+    np.put_along_axis(ranks, order, np.arange(1, values.shape[1] + 1, dtype=np.int16)[None, :], axis=1)
+    return ranks
+
+
+def duration_curve(values: np.ndarray) -> np.ndarray:
+    """
+    Values of each row sorted from largest to smallest.
+    """
+    return -np.sort(-values, axis=1)
+
+
+def ntile(ranks: np.ndarray, n: int) -> np.ndarray:
+    """
+    Group (1 to n) of each value from its descending_rank, in groups of equal size with group n holding the largest
+    values, like dplyr's ntile.
+    """
+    count = ranks.shape[1]
+    return (n * (count - ranks.astype(np.int64)) // count + 1).astype(np.int16)
+
+
+def group_means(values: np.ndarray, groups: np.ndarray, n: int) -> np.ndarray:
+    """
+    Mean of each row over the hours of each group, for groups numbered 0 to n - 1. groups is the group of every hour,
+    either the same for every row (an array of hours) or for each row (years x hours). Returns a years x n array, with
+    NaN for groups without hours.
+    """
+    rows = np.arange(values.shape[0])[:, None]
+    # Every row and group is one bin, so a single bincount sums every group of every row
+    bins = (rows * n + np.broadcast_to(groups, values.shape)).ravel()
+    sums = np.bincount(bins, weights=values.ravel(), minlength=values.shape[0] * n)
+    counts = np.bincount(bins, minlength=values.shape[0] * n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (sums / counts).reshape(values.shape[0], n)
+
+
+def _positions(labels: np.ndarray, values) -> tuple:
+    """
+    Position of each of values in the sorted array labels, and whether it is there.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    positions = np.minimum(np.searchsorted(labels, values), len(labels) - 1)
+    return positions, labels[positions] == values
+
+
+class YearHourGrid:
+    """
+    Years and hours of the hour to segment mapping (rep_hours), for holding hourly values as years x hours arrays.
+    Segment values are placed on every hour of their segment.
+    """
+
+    def __init__(self, rep_hours: pd.DataFrame, years: list = None):
+        rep_hours = rep_hours[["year", "hour", "segment"]].drop_duplicates()
+        self.years = np.unique(np.asarray(years if years is not None else rep_hours["year"], dtype=np.int64))
+        self.hours = np.unique(rep_hours["hour"].to_numpy(dtype=np.int64))
+        self._segments = self.values(rep_hours, "segment", fill=-1).astype(np.int64)
+
+    def values(self, df: pd.DataFrame, column: str, fill: float = 0.0) -> np.ndarray:
+        """
+        Years x hours array of column of df, which has one row per year and hour. Missing hours are fill, and rows of
+        other years or hours are left out.
+        """
+        grid = np.full((len(self.years), len(self.hours)), fill, dtype=np.float64)
+        rows, year_found = _positions(self.years, df["year"])
+        cols, hour_found = _positions(self.hours, df["hour"])
+        found = year_found & hour_found
+        grid[rows[found], cols[found]] = df[column].to_numpy(dtype=np.float64)[found]
+        return grid
+
+    def segment_values(self, df: pd.DataFrame, column: str, fill: float = 0.0) -> np.ndarray:
+        """
+        Years x hours array of column of df, which has one row per year and segment, with each segment's value on
+        every hour of the segment. Missing segments are fill.
+        """
+        segment = df["segment"].to_numpy(dtype=np.int64)
+        # One column per segment number, and a last column of fill for hours without a segment
+        segments = int(max(self._segments.max(), segment.max(initial=0))) + 1
+        table = np.full((len(self.years), segments + 1), fill, dtype=np.float64)
+        rows, found = _positions(self.years, df["year"])
+        table[rows[found], segment[found]] = df[column].to_numpy(dtype=np.float64)[found]
+        return np.take_along_axis(table, np.where(self._segments < 0, segments, self._segments), axis=1)
+
+    def frame(self, **columns) -> pd.DataFrame:
+        """
+        Long table with year and hour columns and one column per years x hours array.
+        """
+        return self.by_year(self.hours, "hour", **columns)
+
+    def by_year(self, index: np.ndarray, name: str, labels: dict = None, **columns) -> pd.DataFrame:
+        """
+        Long table of years x n arrays, with a year column, the constant columns in labels (e.g. {"tech": "Solar"}) and
+        a name column holding the n values of index.
+        """
+        return pd.DataFrame({"year": np.repeat(self.years, len(index)).astype(np.int16), **(labels or {}),
+                             name: np.tile(np.asarray(index), len(self.years)).astype(np.int16),
+                             **{col: values.ravel() for col, values in columns.items()}})
@@ -0,0 +1,36 @@
+# Both GDX readers give the same records (see compare_readers). Needs a GAMS installation to write the GDX file, and is
+# skipped without one. Run with `python -m pytest` in code.
+import pytest
+
+gt = pytest.importorskip("gams.transfer")
+import gdx_reader
+
+
+@pytest.fixture(scope="module")
+def gdx_file(tmp_path_factory):
+    try:
+        container = gt.Container()
+    except Exception as e:
+        pytest.skip(f"No GAMS installation ({e})")
+    if gdx_reader.Gams2Numpy is None:
+        pytest.skip("gams.core.numpy is not available")
+    r = gt.Set(container, "r", records=["PGE", "SCE", "Oregon"])
+    t = gt.Set(container, "t", records=["2020", "2025", "2030"])
+    gt.Parameter(container, "load", [r, t], records=[["PGE", "2020", 1.5], ["SCE", "2025", 2.5], ["Oregon", "2030", 3.0]])
+    # Repeated domain (columns r_0, r_1) and a * domain (uni)
+    gt.Parameter(container, "flow", [r, r, "*"], records=[["PGE", "Oregon", "ac", 0.5], ["SCE", "PGE", "dc", 0.25]])
+    gt.Variable(container, "X", domain=[r, t], records=[["PGE", "2030", 4.0], ["Oregon", "2020", 5.0]])
+    path = str(tmp_path_factory.mktemp("gdx") / "readers.gdx")
+    container.write(path)
+    return path
+
+
+def test_readers_match(gdx_file):
+    differences = gdx_reader.compare_readers(gdx_file)
+    assert differences == {symbol: None for symbol in differences}
+    assert set(differences) == {"r", "t", "load", "flow", "X"}
+
+
+def test_missing_symbols_are_left_out(gdx_file):
+    for read in (gdx_reader.read_numpy, gdx_reader.read_transfer):
+        assert set(read(gdx_file, ["load", "missing"])) == {"load"}
@@ -0,0 +1,44 @@
+# Input cache keys (see input_cache.py) do not depend on what the process has loaded before. Run with
+# `python -m pytest` in code.
+import pandas as pd
+from input_cache import InputCache
+from schema import Schema
+
+
+def regions(schema: Schema, labels: list) -> pd.Categorical:
+    # Regions as cal_r records normalize them, a categorical of the shared region domain
+    return schema.normalize(pd.DataFrame({"r": labels}), "cal_r")["r"].values
+
+
+def test_key_ignores_grown_domains(tmp_path):
+    source = tmp_path / "segdata.gdx"
+    source.write_bytes(b"records")
+    cache = InputCache(str(tmp_path / "cache"), version=1)
+    sources = {str(source): ["load_s"]}
+
+    fresh = regions(Schema(), ["PGE", "SCE"])
+    grown = Schema()
+    regions(grown, ["Oregon", "Arizona", "IID"])
+    grown = regions(grown, ["SCE", "PGE"])
+    assert not fresh.categories.equals(grown.categories)
+
+    key = cache.key("h_load", sources, ((fresh,), [], [2020, 2030]))
+    assert cache.key("h_load", sources, ((grown,), [], [2020, 2030])) == key
+    assert cache.key("h_load", sources, ((regions(Schema(), ["PGE"]),), [], [2020, 2030])) != key
+
+
+def test_save_keeps_entries_until_sources_change(tmp_path):
+    source = tmp_path / "segdata.gdx"
+    source.write_bytes(b"records")
+    cache = InputCache(str(tmp_path / "cache"), version=1)
+    sources = {str(source): ["load_s"]}
+    keys = [cache.key("h_load", sources, (regions, [2020])) for regions in (["PGE"], ["PGE", "SCE"])]
+    for key, value in zip(keys, [1.0, 2.0]):
+        cache.save(key, "h_load", sources, pd.DataFrame({"value": [value]}))
+    assert [cache.load(key)["value"][0] for key in keys] == [1.0, 2.0]
+
+    source.write_bytes(b"new records")
+    cache = InputCache(str(tmp_path / "cache"), version=1)
+    key = cache.key("h_load", sources, (["PGE"], [2020]))
+    cache.save(key, "h_load", sources, pd.DataFrame({"value": [3.0]}))
+    assert sorted(path.name for path in (tmp_path / "cache").iterdir()) == sorted([key + ".json", key + ".pkl"])
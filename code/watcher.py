@@ -0,0 +1,64 @@
+# Polling for new or updated files, used by 1_extract_data.py --watch to extract REGEN cases as their GDX files land.
+import os
+import glob
+import time
+
+
+class Watcher:
+    """
+    Polls glob patterns for files that are new or have changed since they were last reported. A file is only reported
+    once its size and mtime have stayed the same for settle_s seconds, so files still being written by a solve are not
+    picked up half written. A file is reported once per change, however many polls see it.
+
+        watcher = Watcher(["../RegenCases/allstate/*/elec/out/*.elec.gdx"], settle_s=60)
+        while True:
+            for path in watcher.poll():
+                ...
+            time.sleep(30)
+    """
+
+    def __init__(self, patterns: list, settle_s: float = 60):
+        self.patterns = patterns
+        self.settle_s = settle_s
+        # path -> (size, mtime) when it was last reported
+        self._reported = {}
+        # path -> ((size, mtime), time it was first seen with that size and mtime)
+        self._pending = {}
+
+    def poll(self, now: float = None) -> list:
+        """
+        Paths that are new or changed and have been stable for settle_s seconds, in sorted order.
+        """
+        now = time.time() if now is None else now
+        paths = sorted({path for pattern in self.patterns for path in glob.glob(pattern)})
+        ready = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Removed or replaced between glob and stat; seen again on the next poll
+                continue
+            signature = (stat.st_size, stat.st_mtime)
+            if self._reported.get(path) == signature:
+                self._pending.pop(path, None)
+                continue
+            pending = self._pending.get(path)
+            if pending is None or pending[0] != signature:
+                self._pending[path] = (signature, now)
+            elif now - pending[1] >= self.settle_s:
+                ready.append(path)
+                self._reported[path] = signature
+                del self._pending[path]
+        # Forget files that were deleted, so they are reported again if they come back
+        existing = set(paths)
+        for path in [p for p in self._pending if p not in existing]:
+            del self._pending[path]
+        for path in [p for p in self._reported if p not in existing]:
+            del self._reported[path]
+        return ready
+
+    def waiting(self) -> list:
+        """
+        Paths seen changing that are not yet stable.
+        """
+        return sorted(self._pending)
@@ -0,0 +1,85 @@
+# Background writing of outputs, so serializing and compressing a finished output overlaps with computing the next.
+import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+class WriterPool:
+    """
+    Runs writes on worker threads while the caller carries on. Writes are queued with the memory of the frame being
+    written, and submit blocks while the frames queued or being written hold more than max_pending_bytes, so finished
+    outputs cannot pile up in memory faster than they are written. A frame larger than the limit is still accepted once
+    nothing else is pending.
+
+    A failed write does not stop the others. Failures are raised together by close, once every write has finished.
+    With workers=0 every write runs in the calling thread as it is submitted, and a failure is raised straight away.
+
+        with WriterPool(2, 1e9) as writers:
+            writers.submit("trade_gw", write_output_file, df, folder, "trade_gw", size=df.memory_usage(deep=True).sum())
+    """
+
+    def __init__(self, workers: int = 2, max_pending_bytes: float = None):
+        self.max_pending_bytes = max_pending_bytes
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="writer") if workers > 0 else None
+        self._condition = threading.Condition()
+        self._pending = 0
+        # Output name -> traceback of each failed write
+        self.errors = {}
+        # Seconds submit spent waiting for queued writes to finish
+        self.waited_s = 0.0
+
+    def submit(self, name: str, func, *args, size: int = 0):
+        """
+        Queue func(*args), which writes output name. size is the memory, in bytes, that the write keeps alive until it
+        has finished. Blocks while too much memory is queued.
+        """
+        if self._executor is None:
+            func(*args)
+            return
+        with self._condition:
+            start = time.perf_counter()
+            while self._pending and self.max_pending_bytes is not None and self._pending + size > self.max_pending_bytes:
+                self._condition.wait()
+            self.waited_s += time.perf_counter() - start
+            self._pending += size
+        self._executor.submit(self._run, name, func, args, size)
+
+    def _run(self, name: str, func, args: tuple, size: int):
+        try:
+            func(*args)
+        except Exception:
+            self.errors[name] = traceback.format_exc()
+        finally:
+            with self._condition:
+                self._pending -= size
+                self._condition.notify_all()
+
+    def wait(self):
+        """
+        Wait for every queued write to finish. No more writes can be submitted.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def close(self):
+        """
+        Wait for every queued write to finish. Raises RuntimeError listing the writes that failed.
+        """
+        self.wait()
+        if self.errors:
+            raise RuntimeError(f"Writing {', '.join(self.errors)} failed:\n" + "\n".join(self.errors.values()))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+            return
+        # Something else already failed. Still let the queued writes finish, and report failed writes without hiding
+        # the original error.
+        try:
+            self.close()
+        except RuntimeError as e:
+            print(e)